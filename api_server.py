@@ -0,0 +1,271 @@
+"""
+Headless HTTP API for the chat engine.
+
+Serves the same conversations, providers and document ingestion as the
+Streamlit app, without a browser. Handlers run on one asyncio event loop;
+the blocking engine work (database, provider calls, document parsing) runs
+on a bounded thread pool, so many clients can wait on slow models at once.
+Answers can be streamed as Server-Sent Events.
+
+The server keeps no per-client state - sessions are identified by the
+X-Session-Id header and everything else lives in the database - so several
+replicas can run side by side behind a load balancer. Conversation caches
+stay in step with writes from other replicas and from the Streamlit app
+through the database's version table (see conversation_cache.py).
+
+Usage:
+    python api_server.py --host 0.0.0.0 --port 8000
+
+Endpoints:
+    GET    /health
+    GET    /v1/conversations
+    POST   /v1/conversations
+    GET    /v1/conversations/{conversation_id}/messages
+    POST   /v1/conversations/{conversation_id}/messages
+    DELETE /v1/conversations/{conversation_id}
+    POST   /v1/documents                      (multipart, field "file")
+    GET    /v1/documents/{document_hash}
+
+A message request looks like
+    {"prompt": "...", "provider": {"kind": "ollama", "model": "llama3"},
+     "fallbacks": [...], "document_hash": "...", "image": "<base64>", "stream": false}
+"fallbacks" can't be combined with "stream": true.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from engine import ChatEngine, provider_from_config
+from ingestion import submit_ingestion
+from model import ChatDatabase
+from rate_limit import RateLimitExceeded
+
+# Threads for blocking engine work; bounds how many requests are in flight at once
+API_WORKERS = int(os.environ.get("OFFGRID_API_WORKERS", "32"))
+
+DB_KEY = web.AppKey("db", ChatDatabase)
+ENGINE_KEY = web.AppKey("engine", ChatEngine)
+EXECUTOR_KEY = web.AppKey("executor", ThreadPoolExecutor)
+
+
+async def _run(request, function, *args, **kwargs):
+    """Run a blocking call on the server's thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app[EXECUTOR_KEY], lambda: function(*args, **kwargs))
+
+
+def _session_id(request):
+    return request.headers.get("X-Session-Id") or request.remote
+
+
+def _error(status, message, **headers):
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+
+def _rate_limited(e):
+    return _error(429, str(e), **{"Retry-After": str(max(1, round(e.retry_after)))})
+
+
+async def health(request):
+    return web.json_response({"status": "ok"})
+
+
+async def list_conversations(request):
+    conversations = await _run(request, request.app[DB_KEY].get_all_conversations)
+    return web.json_response(conversations)
+
+
+async def create_conversation(request):
+    return web.json_response({"conversation_id": request.app[DB_KEY].generate_conversation_id()}, status=201)
+
+
+async def get_messages(request):
+    messages = await _run(request, request.app[DB_KEY].get_conversation_messages,
+                          request.match_info["conversation_id"])
+    # Cached messages are shared and read-only; decoded thumbnails are only for the Streamlit renderer
+    return web.json_response([{k: v for k, v in message.items() if k != "image_bytes"} for message in messages])
+
+
+async def delete_conversation(request):
+    deleted = await _run(request, request.app[DB_KEY].delete_conversation, request.match_info["conversation_id"])
+    if not deleted:
+        return _error(500, "Failed to delete the conversation")
+    return web.Response(status=204)
+
+
+async def _send_event(response, event, payload):
+    await response.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+
+async def _stream_message(request, conversation_id, body, provider):
+    """Relay the engine's answer stream to the client as Server-Sent Events"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = []
+
+    def produce():
+        # Runs on the thread pool; hands every item to the event loop as soon as it arrives
+        stream = request.app[ENGINE_KEY].stream_message(
+            conversation_id,
+            body["prompt"],
+            provider,
+            document_hash=body.get("document_hash"),
+            image_data=body.get("image")
+        )
+        try:
+            for item in stream:
+                if cancelled:
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+        finally:
+            # Closing the generator also closes the upstream HTTP stream
+            stream.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    producer = loop.run_in_executor(request.app[EXECUTOR_KEY], produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            event, payload = item
+            if event == "token":
+                await _send_event(response, "token", {"content": payload})
+            elif event == "done":
+                await _send_event(response, "done", payload)
+            else:
+                status = 429 if isinstance(payload, RateLimitExceeded) else 502
+                await _send_event(response, "error", {"error": str(payload), "status": status})
+    except (ConnectionResetError, asyncio.CancelledError):
+        # The client went away; stop generating at the next chunk
+        cancelled.append(True)
+        raise
+    await producer
+    await response.write_eof()
+    return response
+
+
+async def post_message(request):
+    conversation_id = request.match_info["conversation_id"]
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return _error(400, "Request body must be JSON")
+    if not isinstance(body, dict) or not body.get("prompt"):
+        return _error(400, "'prompt' is required")
+
+    session_id = _session_id(request)
+    on_usage = request.app[DB_KEY].record_usage
+    try:
+        provider = provider_from_config(body.get("provider") or {"kind": "ollama"}, session_id, on_usage)
+        fallbacks = [provider_from_config(config, session_id, on_usage) for config in body.get("fallbacks") or []]
+    except ValueError as e:
+        return _error(400, str(e))
+
+    if body.get("stream"):
+        # Part of an answer may already be sent when a provider fails, so a stream can't fail over
+        if fallbacks:
+            return _error(400, "'fallbacks' can't be combined with 'stream'")
+        return await _stream_message(request, conversation_id, body, provider)
+
+    try:
+        message = await _run(
+            request,
+            request.app[ENGINE_KEY].send_message,
+            conversation_id,
+            body["prompt"],
+            provider,
+            fallbacks=fallbacks,
+            document_hash=body.get("document_hash"),
+            image_data=body.get("image")
+        )
+    except RateLimitExceeded as e:
+        return _rate_limited(e)
+    except ValueError as e:
+        return _error(400, str(e))
+    except Exception as e:
+        logging.error(f"API message failed: {str(e)}")
+        return _error(502, str(e))
+    return web.json_response(message)
+
+
+async def upload_document(request):
+    reader = await request.multipart()
+    field = await reader.next()
+    while field is not None and field.name != "file":
+        field = await reader.next()
+    if field is None:
+        return _error(400, "Multipart field 'file' is required")
+
+    data = await field.read()
+    job = await _run(
+        request,
+        submit_ingestion,
+        request.app[DB_KEY],
+        field.filename or "document",
+        field.headers.get("Content-Type", ""),
+        bytes(data),
+        conversation_id=request.query.get("conversation_id")
+    )
+    job.pop("content", None)
+    return web.json_response(job, status=202)
+
+
+async def get_document(request):
+    job = await _run(request, request.app[DB_KEY].get_ingestion_job, request.match_info["document_hash"])
+    if job is None:
+        return _error(404, "Unknown document")
+    job.pop("content", None)
+    return web.json_response(job)
+
+
+def create_app(db=None, workers=API_WORKERS):
+    """
+    Build the aiohttp application.
+
+    Args:
+        db (ChatDatabase): Database to serve; defaults to OFFGRID_DB_PATH or chat_history.db
+        workers (int): Size of the thread pool for blocking engine work
+    """
+    app = web.Application()
+    app[DB_KEY] = db or ChatDatabase(os.environ.get("OFFGRID_DB_PATH", "chat_history.db"))
+    app[ENGINE_KEY] = ChatEngine(app[DB_KEY])
+    app[EXECUTOR_KEY] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+
+    async def shutdown_executor(app):
+        app[EXECUTOR_KEY].shutdown(wait=False, cancel_futures=True)
+
+    app.on_cleanup.append(shutdown_executor)
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/v1/conversations", list_conversations),
+        web.post("/v1/conversations", create_conversation),
+        web.get("/v1/conversations/{conversation_id}/messages", get_messages),
+        web.post("/v1/conversations/{conversation_id}/messages", post_message),
+        web.delete("/v1/conversations/{conversation_id}", delete_conversation),
+        web.post("/v1/documents", upload_document),
+        web.get("/v1/documents/{document_hash}", get_document),
+    ])
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offgrid UI headless API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Threads for blocking engine work")
+    args = parser.parse_args(argv)
+    web.run_app(create_app(workers=args.workers), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,21 @@
 import streamlit as st
 import os
-from openai_llm import call_openai_llm
-from ollama_llm import call_ollama_llm
-from replicate_llms import call_replicate_model
-from PIL import Image
-import io
+from ollama_llm import DRAFT_OLLAMA_MODEL, is_model_available, preload_ollama_model
 import base64
 import uuid
 from model import ChatDatabase
+from engine import ChatEngine
+from ingestion import submit_ingestion
+from providers import estimate_tokens, openai_provider, replicate_provider, ollama_provider
+from routing import DEFAULT_HEDGE_PERCENTILE
+from rate_limit import RateLimitExceeded
 
-# Optional imports for file handling - will be imported dynamically when needed
-# import pandas as pd
-# import PyPDF2
-# import docx
+DB_PATH = os.environ.get("OFFGRID_DB_PATH", "chat_history.db")
 
-# Initialize database
-db = ChatDatabase()
+# Recently updated conversations loaded in the background when the sidebar is shown
+PREFETCH_CONVERSATIONS = 5
 
-# Set page configuration
+# Set page configuration (must be the first Streamlit command - cached functions show a spinner)
 st.set_page_config(
     page_title="AI Assistant",
     page_icon="🤖",
@@ -25,197 +23,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS
-st.markdown("""
-<style>
-    /* Main background and container styles */
-    .main {
-        background-color: #1e1e2e;
-        color: #cdd6f4;
-        font-family: 'Inter', sans-serif;
-    }
-    
-    /* Container styling */
-    .stApp {
-        max-width: 1200px;
-        margin: 0 auto;
-    }
-    
-    /* Chat containers */
-    .chat-container {
-        margin-bottom: 2rem;
-        padding-bottom: 1rem;
-        border-bottom: 1px solid #313244;
-    }
-    
-    /* Chat message styling */
-    .chat-message {
-        padding: 1.2rem;
-        border-radius: 12px;
-        margin-bottom: 1.5rem;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-        font-size: 16px;
-        line-height: 1.5;
-    }
-    
-    .user-message {
-        background-color: #313244;
-        color: #cdd6f4;
-        margin-left: 2rem;
-        border-top-left-radius: 2px;
-    }
-    
-    .assistant-message {
-        background-color: #45475a;
-        color: #cdd6f4;
-        margin-right: 2rem;
-        border-top-right-radius: 2px;
-    }
-    
-    /* Avatar styling */
-    .avatar-container {
-        padding: 0.5rem;
-        background-color: #1e1e2e;
-        border-radius: 50%;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        width: 48px;
-        height: 48px;
-        font-size: 2rem;
-        box-shadow: 0 2px 5px rgba(0, 0, 0, 0.2);
-        margin: 0 auto;
-    }
-    
-    .user-avatar {
-        background-color: #89b4fa;
-        color: #1e1e2e;
-    }
-    
-    .assistant-avatar {
-        background-color: #f38ba8;
-        color: #1e1e2e;
-    }
-    
-    /* Title and subtitle styling */
-    .title {
-        text-align: center;
-        color: #cdd6f4;
-        font-size: 2.5rem;
-        font-weight: 700;
-        margin-bottom: 0.5rem;
-        text-shadow: 0px 2px 4px rgba(0, 0, 0, 0.1);
-    }
-    
-    .subtitle {
-        text-align: center;
-        color: #a6adc8;
-        font-size: 1.1rem;
-        margin-bottom: 2rem;
-    }
-    
-    /* Input fields */
-    .stTextInput, .stTextArea, div[data-baseweb="input"] input {
-        background-color: #313244 !important;
-        color: #cdd6f4 !important;
-        border: 1px solid #45475a !important;
-        border-radius: 8px !important;
-    }
-    
-    /* Button styling */
-    .stButton button {
-        background-color: #cba6f7 !important;
-        color: #1e1e2e !important;
-        font-weight: 600 !important;
-        border-radius: 8px !important;
-        border: none !important;
-        padding: 0.5rem 1rem !important;
-        transition: all 0.2s ease !important;
-    }
-    
-    .stButton button:hover {
-        background-color: #f5c2e7 !important;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2) !important;
-    }
-    
-    /* Chat input styling */
-    .stChatInput {
-        border-radius: 16px !important;
-        overflow: hidden !important;
-    }
-    
-    /* Make sidebar more modern */
-    [data-testid="stSidebar"] {
-        background-color: #181825 !important;
-        border-right: 1px solid #313244 !important;
-        padding: 1rem !important;
-    }
-    
-    /* Headers in sidebar */
-    [data-testid="stSidebar"] h1, [data-testid="stSidebar"] h2, [data-testid="stSidebar"] h3 {
-        color: #cba6f7 !important;
-        font-weight: 600 !important;
-    }
-    
-    /* Sidebar divider */
-    [data-testid="stSidebar"] hr {
-        border-color: #313244 !important;
-        margin: 1.5rem 0 !important;
-    }
-    
-    /* Images */
-    img {
-        border-radius:.5rem !important;
-        margin: 1rem 0 !important;
-    }
-    
-    /* Scrollbar styling */
-    ::-webkit-scrollbar {
-        width: 8px;
-        height: 8px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: #181825;
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: #45475a;
-        border-radius: 10px;
-    }
-    
-    ::-webkit-scrollbar-thumb:hover {
-        background: #cba6f7;
-    }
-    
-    /* Error messages */
-    .stAlert {
-        background-color: #313244 !important;
-        color: #f38ba8 !important;
-        border-left-color: #f38ba8 !important;
-    }
-    
-    /* Warning messages */
-    .stWarning {
-        background-color: #313244 !important;
-        color: #fab387 !important;
-        border-left-color: #fab387 !important;
-    }
-    
-    /* Spinner */
-    .stSpinner > div > div {
-        border-color: #cba6f7 transparent transparent !important;
-    }
-    
-    /* Conversation selector styling */
-    .conversation-selector {
-        background-color: #313244;
-        padding: 0.5rem;
-        border-radius: 8px;
-        margin-bottom: 1rem;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Initialize database once per server process instead of on every rerun
+@st.cache_resource
+def get_database(db_path):
+    return ChatDatabase(db_path)
+
+db = get_database(DB_PATH)
+engine = ChatEngine(db)
+
+# Custom CSS (read from disk once per server process)
+@st.cache_resource
+def load_css():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "style.css")) as f:
+        return f"<style>\n{f.read()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Initialize session state for API key and current conversation
 if "api_key" not in st.session_state:
@@ -225,6 +47,10 @@ if "api_key" not in st.session_state:
 if "current_conversation_id" not in st.session_state:
     st.session_state.current_conversation_id = db.generate_conversation_id()
 
+# Identify this browser session for fair queueing on the shared Ollama host
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 # Initialize or get the offgrid state
 if "offgrid" not in st.session_state:
     st.session_state.offgrid = False
@@ -287,6 +113,25 @@ with st.sidebar:
         
         if api_key:
             st.session_state.api_key = api_key
+        
+        # Failover to the local model keeps the chat working when the network is gone
+        fallback_to_ollama = st.toggle("Fall back to local Ollama if the online model fails", key="fallback_to_ollama")
+        if fallback_to_ollama:
+            st.text_input("Fallback Ollama model", value=st.session_state.get("model_option", "deepseek-r1"), key="fallback_ollama_model")
+            st.toggle(
+                "Hedge slow requests",
+                key="hedge_requests",
+                help="Also ask the local model when the online model is slower than its usual 95th percentile; the first answer wins."
+            )
+        
+        # A small local model fills the wait for slow reasoning models
+        show_local_draft = st.toggle(
+            "Show a local draft while waiting",
+            key="show_local_draft",
+            help="Streams a quick answer from your local Ollama model until the online answer arrives. Only the online answer is saved."
+        )
+        if show_local_draft:
+            st.text_input("Draft Ollama model", value=DRAFT_OLLAMA_MODEL, key="draft_ollama_model")
     else:
         # Offline mode - Ollama
         st.session_state.model = "local"
@@ -299,9 +144,35 @@ with st.sidebar:
         st.session_state.model_option = ollama_model
         st.write(f"Using local model: {ollama_model}")
         
+        # Warm the model up as soon as it is chosen so the first message doesn't pay the load time
+        if is_model_available(ollama_model) is False:
+            st.warning(f"Model '{ollama_model}' is not installed. Run `ollama pull {ollama_model}` in your terminal.")
+        elif st.session_state.get("preloaded_model") != ollama_model:
+            preload_ollama_model(ollama_model, session_id=st.session_state.session_id)
+            st.session_state.preloaded_model = ollama_model
+        
         # Help text
         st.markdown("*Common models: llama3, deepseek-r1, mistral, phi3*")
     
+    # Compare mode - send each prompt to several models at once
+    compare_mode = st.toggle("Compare models side by side", key="compare_mode")
+    if compare_mode:
+        compare_choices = st.multiselect(
+            "Models to compare",
+            ("OpenAI/o3-mini", "Replicate", "Ollama (local)"),
+            default=["OpenAI/o3-mini", "Ollama (local)"],
+            key="compare_choices"
+        )
+        if "OpenAI/o3-mini" in compare_choices:
+            st.text_input("OpenAI API Key for compare", type="password", key="compare_openai_api_key")
+        if "Replicate" in compare_choices:
+            st.text_input("Replicate API Key for compare", type="password", key="compare_replicate_api_key")
+            st.text_input("Replicate Model ID for compare", value="meta/meta-llama-3-70b-instruct", key="compare_replicate_model_id")
+        if "Ollama (local)" in compare_choices:
+            st.text_input("Ollama model name for compare", value=st.session_state.get("model_option", "deepseek-r1"), key="compare_ollama_model")
+        if len(compare_choices) < 2:
+            st.caption("Pick at least two models to compare.")
+    
     st.divider()
     
     # Get all conversations from database
@@ -318,15 +189,17 @@ with st.sidebar:
         
         # Show existing conversations
         if conversations:
+            # Warm the cache with the most recently updated conversations, so switching to them is instant
+            recent = sorted(conversations, key=lambda conv: conv['last_updated'], reverse=True)
+            db.prefetch_conversations([conv['conversation_id'] for conv in recent[:PREFETCH_CONVERSATIONS]])
+            
             st.markdown("<p>Select a conversation:</p>", unsafe_allow_html=True)
             for conv in conversations:
                 conv_id = conv['conversation_id']
-                # Get the first message to use as a title
-                messages = db.get_conversation_messages(conv_id)
                 title = "Conversation"
-                if messages:
+                if conv['first_message']:
                     # Use first few characters of first message as title
-                    first_msg = messages[0]['content']
+                    first_msg = conv['first_message']
                     title = first_msg[:20] + "..." if len(first_msg) > 20 else first_msg
                 
                 if st.button(f"{title}", key=conv_id, use_container_width=True):
@@ -341,6 +214,13 @@ with st.sidebar:
             # Create a new conversation ID
             st.session_state.current_conversation_id = db.generate_conversation_id()
             st.rerun()
+        
+        # Estimated token usage of this browser session
+        for usage in db.get_usage_summary(session_id=st.session_state.session_id):
+            st.caption(
+                f"{usage['provider']}: {usage['requests']} request(s), "
+                f"~{usage['prompt_tokens'] + usage['completion_tokens']} tokens this session"
+            )
     except Exception as e:
         st.error(f"Error loading conversations: {str(e)}")
 
@@ -390,14 +270,35 @@ with st.sidebar:
     
     
 
+def format_answer_metrics(message):
+    """Caption with the provider, latency and token rate of an assistant answer"""
+    parts = []
+    if message.get("provider"):
+        parts.append(message["provider"])
+    latency = message.get("latency")
+    if latency:
+        parts.append(f"{latency:.1f}s")
+        parts.append(f"{estimate_tokens(message['content']) / latency:.0f} tokens/s")
+    return " · ".join(parts)
+
 # Display chat messages from the database
 try:
     messages = db.get_conversation_messages(st.session_state.current_conversation_id)
     
+    # Answers from compare mode share a group_id and are shown side by side
+    message_groups = []
     for message in messages:
+        group_id = message.get("group_id")
+        if group_id and message_groups and message_groups[-1][0].get("group_id") == group_id:
+            message_groups[-1].append(message)
+        else:
+            message_groups.append([message])
+    
+    for group in message_groups:
+        message = group[0]
         role = message["role"]
         content = message["content"]
-        image_data = message.get("image")
+        image_data = message.get("image_bytes")
         
         # Determine message styling based on role
         message_class = "user-message" if role == "user" else "assistant-message"
@@ -411,23 +312,74 @@ try:
             with col1:
                 st.markdown(f"<div class='avatar-container {avatar_class}'>{avatar}</div>", unsafe_allow_html=True)
             with col2:
-                st.markdown(f"<div class='chat-message {message_class}'>{content}</div>", unsafe_allow_html=True)
+                if len(group) > 1:
+                    for answer_column, answer in zip(st.columns(len(group)), group):
+                        with answer_column:
+                            st.caption(format_answer_metrics(answer))
+                            st.markdown(f"<div class='chat-message {message_class}'>{answer['content']}</div>", unsafe_allow_html=True)
+                else:
+                    st.markdown(f"<div class='chat-message {message_class}'>{content}</div>", unsafe_allow_html=True)
+                    if role == "assistant" and message.get("provider"):
+                        st.caption(format_answer_metrics(message))
                 
-                # Display image if present
+                # Display image if present (the stored thumbnail, already small and browser-ready)
                 if image_data:
                     try:
-                        image = Image.open(io.BytesIO(base64.b64decode(image_data)))
-                        st.image(image, use_column_width=True)
+                        st.image(image_data)
                     except Exception as e:
                         st.error(f"Error displaying image: {e}")
             st.markdown("</div>", unsafe_allow_html=True)
 except Exception as e:
     st.error(f"Error loading messages: {str(e)}")
 
+def show_ingestion_status(document_hash):
+    """Progress of a background document ingestion; polls while the job is unfinished"""
+    job = db.get_ingestion_job(document_hash)
+    unfinished = job is not None and job["status"] in ("pending", "running")
+    
+    @st.fragment(run_every=1.0 if unfinished else None)
+    def ingestion_status():
+        job = db.get_ingestion_job(document_hash)
+        if job is None:
+            return
+        if job["status"] in ("pending", "running"):
+            st.progress(job["progress"], text=f"Processing {job['file_name']}...")
+        elif job["status"] == "failed":
+            st.warning(f"Couldn't process {job['file_name']}: {job['error']}")
+        elif unfinished:
+            # Finished since the last full run - rerun once to stop polling
+            st.rerun()
+        else:
+            st.caption(f"{job['file_name']} is ready")
+    
+    ingestion_status()
+
 # User input section
 with st.container():
     st.markdown("<div style='margin-top: 2rem;'></div>", unsafe_allow_html=True)
-    uploaded_file = st.file_uploader("Upload a document to analyze (xlsx, csv, pdf, docx, txt)", type=["xlsx", "xls", "csv", "docx", "doc", "txt", "pdf"], label_visibility="visible")
+    uploaded_file = st.file_uploader("Upload a document to analyze (xlsx, csv, pdf, docx, txt) or an image", type=["xlsx", "xls", "csv", "docx", "doc", "txt", "pdf", "png", "jpg", "jpeg", "webp"], label_visibility="visible")
+    uploaded_image = uploaded_file is not None and (uploaded_file.type or "").startswith("image/")
+    
+    # Start parsing uploads in the background right away; the chat stays usable meanwhile
+    if uploaded_file and not uploaded_image:
+        ingested_files = st.session_state.setdefault("ingested_files", {})
+        if uploaded_file.file_id not in ingested_files:
+            job = submit_ingestion(
+                db,
+                uploaded_file.name,
+                uploaded_file.type,
+                uploaded_file.getvalue(),
+                st.session_state.current_conversation_id
+            )
+            ingested_files[uploaded_file.file_id] = job["document_hash"]
+        else:
+            # Same upload, possibly a different conversation now
+            db.attach_document(st.session_state.current_conversation_id, ingested_files[uploaded_file.file_id])
+        show_ingestion_status(ingested_files[uploaded_file.file_id])
+    
+    attached_documents = db.get_conversation_documents(st.session_state.current_conversation_id)
+    if attached_documents:
+        st.caption("Documents in this conversation: " + ", ".join(doc["file_name"] for doc in attached_documents))
     
     prompt = st.chat_input("Type your message here...")
     
@@ -438,146 +390,99 @@ with st.container():
         try:
             # Display a spinner while waiting for the response
             with st.spinner("AI is thinking..."):
-                # Only store image data for actual images, not documents
-                image_data = None
-                
-                # If there's an uploaded file, add information about it to the prompt
-                user_message = prompt
-                if uploaded_file:
-                    file_name = uploaded_file.name
-                    user_message = f"[File attached: {file_name}]\n\n{prompt}"
-                
-                # Save user message to database without attaching the file
-                db.save_message("user", user_message, conversation_id, image_data)
-                
-                # Get previous messages in the conversation for context
-                previous_messages = db.get_conversation_messages(conversation_id)
+                # What the engine needs to assemble the turn; it also saves the user message
+                turn_kwargs = {}
+                if uploaded_image:
+                    # The engine sends a downscaled copy to the model; the database keeps original, model copy and thumbnail
+                    turn_kwargs["image_data"] = base64.b64encode(uploaded_file.getvalue()).decode("ascii")
+                    turn_kwargs["image_name"] = uploaded_file.name
+                elif uploaded_file:
+                    # Use the background ingestion result, waiting for it if it's still running
+                    extraction_progress = st.empty()
+                    turn_kwargs["document_hash"] = st.session_state.ingested_files[uploaded_file.file_id]
+                    turn_kwargs["on_progress"] = lambda job: extraction_progress.progress(
+                        job["progress"], text=f"Reading {uploaded_file.name}..."
+                    )
                 
-                # Format messages for the OpenAI API format
-                conversation_history = []
-                for msg in previous_messages:
-                    # Skip the current message which we already added
-                    if msg["role"] == "user" and msg["content"] == user_message:
-                        continue
-                        
-                    # Format message for the API
-                    conversation_history.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
+                compare_choices = st.session_state.get("compare_choices", []) if st.session_state.get("compare_mode") else []
                 
-                # Create a prompt that includes image description if present
-                llm_prompt = prompt
-                if uploaded_file:
-                    # Read file contents based on file type
-                    file_content = ""
-                    file_type = uploaded_file.type
-                    try:
-                        if file_type == "text/plain" or uploaded_file.name.endswith(".txt"):
-                            # For text files
-                            file_content = uploaded_file.getvalue().decode("utf-8")
-                        elif file_type == "application/pdf" or uploaded_file.name.endswith(".pdf"):
-                            # For PDF files - requires PyPDF2
-                            import PyPDF2
-                            from io import BytesIO
-                            
-                            print(f"Processing PDF file: {uploaded_file.name}, Size: {len(uploaded_file.getvalue())} bytes")
-                            try:
-                                pdf_file = BytesIO(uploaded_file.getvalue())
-                                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                                
-                                # Check if the PDF has any pages
-                                if len(pdf_reader.pages) == 0:
-                                    file_content = "[PDF appears to be empty or corrupted]"
-                                else:
-                                    # Extract text from each page
-                                    for page_num in range(len(pdf_reader.pages)):
-                                        page_text = pdf_reader.pages[page_num].extract_text()
-                                        if page_text.strip():  # Check if extracted text is not empty
-                                            file_content += f"--- Page {page_num + 1} ---\n{page_text}\n\n"
-                                        
-                                        # If no text was extracted (possibly a scanned/image PDF)
-                                        if not file_content.strip():
-                                            # Try to get metadata
-                                            metadata = ""
-                                            if pdf_reader.metadata:
-                                                for key, value in pdf_reader.metadata.items():
-                                                    if key and value and str(value).strip():
-                                                        clean_key = str(key).replace('/', '')
-                                                        metadata += f"{clean_key}: {value}\n"
-                                            
-                                            if metadata:
-                                                file_content = f"[This appears to be a scanned or image-based PDF without extractable text. PDF Metadata:\n{metadata}\n\nConsider using an OCR tool to extract text from the PDF before uploading.]"
-                                            else:
-                                                file_content = "[This appears to be a scanned or image-based PDF without extractable text. Consider using an OCR tool to extract text from the PDF before uploading.]"
-                            except Exception as pdf_error:
-                                print(f"PDF extraction error: {str(pdf_error)}")
-                                # Try to get basic information about the PDF
-                                try:
-                                    file_size = len(uploaded_file.getvalue())
-                                    file_content = f"[Error extracting PDF content: {str(pdf_error)}. File size: {file_size} bytes. The PDF might be password-protected, corrupted, or in an unsupported format.]"
-                                except:
-                                    file_content = f"[Error extracting PDF content: {str(pdf_error)}]"
-                        elif file_type in ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                         "application/vnd.ms-excel"] or uploaded_file.name.endswith((".xlsx", ".xls")):
-                            # For Excel files - requires pandas
-                            import pandas as pd
-                            df = pd.read_excel(uploaded_file)
-                            file_content = df.to_string()
-                        elif file_type == "text/csv" or uploaded_file.name.endswith(".csv"):
-                            # For CSV files - requires pandas
-                            import pandas as pd
-                            df = pd.read_csv(uploaded_file)
-                            file_content = df.to_string()
-                        elif file_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                       "application/msword"] or uploaded_file.name.endswith((".docx", ".doc")):
-                            # For Word files - requires python-docx
-                            import docx
-                            from io import BytesIO
-                            doc = docx.Document(BytesIO(uploaded_file.getvalue()))
-                            file_content = "\n".join([para.text for para in doc.paragraphs])
+                if len(compare_choices) >= 2:
+                    # Compare mode - ask every selected model concurrently and stream the answers side by side
+                    compare_list = []
+                    for choice in compare_choices:
+                        if choice == "OpenAI/o3-mini":
+                            compare_list.append(openai_provider(
+                                st.session_state.get("compare_openai_api_key"),
+                                session_id=st.session_state.session_id,
+                                on_usage=db.record_usage
+                            ))
+                        elif choice == "Replicate":
+                            compare_list.append(replicate_provider(
+                                st.session_state.get("compare_replicate_api_key"),
+                                st.session_state.get("compare_replicate_model_id", "meta/meta-llama-3-70b-instruct"),
+                                session_id=st.session_state.session_id,
+                                on_usage=db.record_usage
+                            ))
                         else:
-                            # For other file types, try to read as text or inform user
-                            try:
-                                file_content = uploaded_file.getvalue().decode("utf-8")
-                            except UnicodeDecodeError:
-                                file_content = "[File content could not be extracted. Unsupported file type.]"
-                        
-                        # Limit content length to avoid overwhelming the models
-                        if len(file_content) > 10000:
-                            file_content = file_content[:10000] + "\n[Content truncated due to length...]"
-                            
-                        # Create the enhanced prompt with file content
-                        llm_prompt = f"""The user has uploaded a file with the following content:
-
-FILE CONTENT:
-{file_content}
-
-USER QUERY:
-{prompt}
-
-Please respond to the user's query based on the file content."""
-                    except Exception as e:
-                        llm_prompt = f"The user has uploaded a file, but I couldn't extract its contents due to error: {str(e)}. User's message: {prompt}"
-                
+                            compare_list.append(ollama_provider(
+                                st.session_state.get("compare_ollama_model", "deepseek-r1"),
+                                session_id=st.session_state.session_id,
+                                on_usage=db.record_usage
+                            ))
+                    
+                    answer_placeholders = []
+                    for answer_column, provider in zip(st.columns(len(compare_list)), compare_list):
+                        answer_column.markdown(f"**{provider.name}**")
+                        answer_placeholders.append(answer_column.empty())
+                        answer_placeholders[-1].info("Waiting for response...")
+                    
+                    def show_compare_chunk(index, answer):
+                        answer_placeholders[index].markdown(answer)
+                    
+                    def show_compare_result(index, result):
+                        if result["error"]:
+                            answer_placeholders[index].error(result["error"])
+                            return
+                        with answer_placeholders[index].container():
+                            st.caption(f"{result['latency']:.1f}s · {result['tokens_per_second']:.0f} tokens/s")
+                            st.markdown(result["response"])
+                    
+                    # The answers are saved as one linked group
+                    results = engine.compare_message(
+                        conversation_id,
+                        prompt,
+                        compare_list,
+                        on_result=show_compare_result,
+                        on_chunk=show_compare_chunk,
+                        **turn_kwargs
+                    )
+                    if any(result["response"] for result in results):
+                        st.rerun()
+                    st.stop()
                 # Modified logic to handle Ollama separately
-                if st.session_state.offgrid:
+                elif st.session_state.offgrid:
                     try:
-                        st.info("Connecting to local Ollama server...")
-                        response = call_ollama_llm(
-                            llm_prompt, 
-                            conversation_history=conversation_history
+                        ollama_status = st.empty()
+                        ollama_status.info("Connecting to local Ollama server...")
+
+                        def show_queue_position(position, estimated_wait):
+                            ollama_status.info(
+                                f"Waiting for the local Ollama server: {position} request(s) ahead of you, "
+                                f"estimated wait {estimated_wait:.0f}s"
+                            )
+
+                        ollama = ollama_provider(
+                            st.session_state.get('model_option', 'deepseek-r1'),
+                            session_id=st.session_state.session_id,
+                            on_wait=show_queue_position,
+                            on_usage=db.record_usage
                         )
-                        if response:
-                            # Save assistant's response to database
-                            db.save_message("assistant", response, conversation_id)
-                            st.rerun()
-                        else:
-                            st.error("""No response from Ollama. Please check:
-1. Ollama is installed (https://ollama.com/download)
-2. Ollama service is running
-3. The model exists locally (run 'ollama pull modelname')""")
-                            st.stop()
+                        # Saves the assistant's response to the database
+                        engine.send_message(conversation_id, prompt, ollama, **turn_kwargs)
+                        st.rerun()
+                    except RateLimitExceeded as e:
+                        ollama_status.warning(str(e))
+                        st.stop()
                     except Exception as e:
                         st.error(f"""Error connecting to Ollama: {str(e)}
                         
@@ -591,22 +496,57 @@ Please verify:
                     if st.session_state.api_key:
                         try:
                             if st.session_state.model == "o3-mini":
-                                response = call_openai_llm(
-                                    llm_prompt, 
+                                primary = openai_provider(
                                     st.session_state.api_key,
-                                    conversation_history=conversation_history
+                                    session_id=st.session_state.session_id,
+                                    on_usage=db.record_usage
                                 )
                             elif st.session_state.model == "replicate":
-                                response = call_replicate_model(
-                                    llm_prompt,
-                                    api_key=st.session_state.api_key,
-                                    model_id=st.session_state.replicate_model_id,
-                                    conversation_history=conversation_history
+                                primary = replicate_provider(
+                                    st.session_state.api_key,
+                                    st.session_state.replicate_model_id,
+                                    session_id=st.session_state.session_id,
+                                    on_usage=db.record_usage
                                 )
                             
-                            # Save assistant's response to database
-                            db.save_message("assistant", response, conversation_id)
+                            # Optionally fall back to (or hedge with) the local Ollama model
+                            fallbacks = []
+                            if st.session_state.get("fallback_to_ollama"):
+                                fallbacks.append(ollama_provider(
+                                    st.session_state.get("fallback_ollama_model", "deepseek-r1"),
+                                    session_id=st.session_state.session_id,
+                                    on_usage=db.record_usage
+                                ))
+                            
+                            # The draft model is text-only, so turns with images just wait for the online answer
+                            if st.session_state.get("show_local_draft") and not uploaded_image:
+                                draft_placeholder = st.empty()
+                                
+                                def show_draft(draft):
+                                    with draft_placeholder.container():
+                                        st.caption("Draft from a local model - the full answer is on its way")
+                                        st.markdown(draft)
+                                
+                                turn_kwargs["draft_provider"] = ollama_provider(
+                                    st.session_state.get("draft_ollama_model") or DRAFT_OLLAMA_MODEL,
+                                    session_id=st.session_state.session_id,
+                                    on_usage=db.record_usage
+                                )
+                                turn_kwargs["on_draft"] = show_draft
+                            
+                            # Saves the assistant's response to the database, with the provider that served it
+                            engine.send_message(
+                                conversation_id,
+                                prompt,
+                                primary,
+                                fallbacks=fallbacks,
+                                hedge_percentile=DEFAULT_HEDGE_PERCENTILE if st.session_state.get("hedge_requests") else None,
+                                **turn_kwargs
+                            )
                             st.rerun()
+                        except RateLimitExceeded as e:
+                            st.warning(str(e))
+                            st.stop()
                         except Exception as e:
                             st.error(f"Error: {str(e)}")
                     else:
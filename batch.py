@@ -0,0 +1,260 @@
+"""
+Batch runner: send a set of prompts (or a folder of documents) through a model.
+
+Input is JSON Lines, one item per line:
+    {"id": "q1", "prompt": "Summarise the attached file", "document": "docs/report.pdf"}
+"id" defaults to the line number and "document" is optional. Alternatively,
+--documents DIR with --prompt runs the same prompt against every file in a folder.
+
+Items run with bounded concurrency. Every finished item is checkpointed to a
+SQLite file, so an interrupted run picks up where it stopped when started
+again with the same arguments; failed items are retried. Results are written
+as JSON Lines in input order, with per-item latency and token rate, and a
+latency summary is printed at the end.
+
+Usage:
+    python batch.py --input prompts.jsonl --output results.jsonl --provider ollama --model llama3
+    python batch.py --documents ./papers --prompt "List the key findings" --output findings.jsonl
+"""
+import argparse
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from documents import extract_document
+from engine import provider_from_config
+from latency_stats import summarize_latencies
+from prompt_builder import build_user_turn
+from providers import estimate_tokens
+from rate_limit import RateLimitExceeded
+
+
+def load_items(input_path=None, documents_dir=None, prompt=None):
+    """Read the work items from a JSONL file or a documents folder"""
+    items = []
+    if input_path:
+        with open(input_path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not record.get("prompt"):
+                    raise ValueError(f"Line {line_number} has no 'prompt'")
+                items.append({
+                    "id": str(record.get("id", line_number)),
+                    "prompt": record["prompt"],
+                    "document": record.get("document")
+                })
+    if documents_dir:
+        if not prompt:
+            raise ValueError("--documents needs --prompt")
+        for name in sorted(os.listdir(documents_dir)):
+            path = os.path.join(documents_dir, name)
+            if os.path.isfile(path):
+                items.append({"id": name, "prompt": prompt, "document": path})
+
+    seen = set()
+    for item in items:
+        if item["id"] in seen:
+            raise ValueError(f"Duplicate item id {item['id']!r}")
+        seen.add(item["id"])
+    return items
+
+
+def _item_hash(item, provider_name):
+    """Identifies an item's inputs, so an edited prompt or another model is not taken from the checkpoint"""
+    key = json.dumps([item["prompt"], item.get("document"), provider_name])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """Finished items of a batch run, in a small SQLite file"""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS batch_items (
+                    item_id TEXT PRIMARY KEY,
+                    input_hash TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    response TEXT,
+                    error TEXT,
+                    latency REAL,
+                    finished_at TEXT
+                )
+            """)
+
+    def get(self, item_id, input_hash):
+        """The stored result of an item, or None if it hasn't run with these inputs"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, response, error, latency FROM batch_items WHERE item_id = ? AND input_hash = ?",
+                (item_id, input_hash)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "response": row[1], "error": row[2], "latency": row[3]}
+
+    def save(self, item_id, input_hash, status, response=None, error=None, latency=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO batch_items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item_id, input_hash, status, response, error, latency, datetime.datetime.utcnow().isoformat())
+            )
+
+    def close(self):
+        self._connection.close()
+
+
+def run_item(item, provider, max_retries=1):
+    """
+    Run one item, waiting out rate limits instead of failing.
+
+    Returns:
+        tuple: (response, latency in seconds)
+
+    Raises:
+        Exception: When the provider fails or returns no answer, so the item is recorded as failed
+    """
+    prompt = item["prompt"]
+    if item.get("document"):
+        with open(item["document"], "rb") as f:
+            data = f.read()
+        file_name = os.path.basename(item["document"])
+        prompt = build_user_turn(prompt, file_name, extract_document(file_name, "", data))
+
+    while True:
+        try:
+            start = time.perf_counter()
+            response = provider(prompt, max_retries=max_retries)
+            latency = time.perf_counter() - start
+        except RateLimitExceeded as e:
+            time.sleep(e.retry_after)
+            continue
+        # An empty answer must not be checkpointed as done, or a re-run would never retry it
+        if not response or not response.strip():
+            raise Exception(f"{provider.name} returned an empty response")
+        return response, latency
+
+
+def run_batch(items, provider, checkpoint, concurrency=4, max_retries=1, on_progress=None):
+    """
+    Run every item not already finished in the checkpoint.
+
+    Args:
+        items (list): Items from load_items()
+        provider (Provider): Model to run them through
+        checkpoint (Checkpoint): Where finished items are recorded
+        concurrency (int): Items in flight at once
+        max_retries (int): Retries per item, passed to the provider call
+        on_progress (callable): Called as on_progress(finished, total) after each item
+
+    Returns:
+        list: One result dict per item, in input order
+    """
+    hashes = {item["id"]: _item_hash(item, provider.name) for item in items}
+    pending = []
+    for item in items:
+        stored = checkpoint.get(item["id"], hashes[item["id"]])
+        if stored is None or stored["status"] != "done":
+            pending.append(item)
+
+    finished = len(items) - len(pending)
+    if on_progress:
+        on_progress(finished, len(items))
+
+    def work(item):
+        try:
+            response, latency = run_item(item, provider, max_retries)
+            checkpoint.save(item["id"], hashes[item["id"]], "done", response=response, latency=latency)
+        except Exception as e:
+            checkpoint.save(item["id"], hashes[item["id"]], "failed", error=str(e))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for future in as_completed([executor.submit(work, item) for item in pending]):
+            future.result()
+            finished += 1
+            if on_progress:
+                on_progress(finished, len(items))
+
+    results = []
+    for item in items:
+        stored = checkpoint.get(item["id"], hashes[item["id"]])
+        latency = stored["latency"]
+        tokens = estimate_tokens(stored["response"])
+        results.append({
+            "id": item["id"],
+            "prompt": item["prompt"],
+            "document": item.get("document"),
+            "provider": provider.name,
+            "status": stored["status"],
+            "response": stored["response"],
+            "error": stored["error"],
+            "latency": latency,
+            "tokens": tokens,
+            "tokens_per_second": tokens / latency if stored["response"] and latency else None
+        })
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a set of prompts or documents through a model")
+    parser.add_argument("--input", help="JSONL file of items ({\"id\", \"prompt\", \"document\"})")
+    parser.add_argument("--documents", help="Folder of documents to run --prompt against")
+    parser.add_argument("--prompt", help="Prompt used with --documents")
+    parser.add_argument("--output", required=True, help="JSONL file to write the results to")
+    parser.add_argument("--checkpoint", help="SQLite checkpoint file (default: <output>.checkpoint.db)")
+    parser.add_argument("--provider", choices=("ollama", "openai", "replicate"), default="ollama")
+    parser.add_argument("--model", help="Model name (Ollama) or model ID (Replicate)")
+    parser.add_argument("--api-key", help="API key (default: OPENAI_API_KEY / REPLICATE_API_TOKEN)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Items in flight at once")
+    parser.add_argument("--max-retries", type=int, default=1, help="Retries per item")
+    parser.add_argument("--verbose", action="store_true", help="Show the provider modules' request logging")
+    args = parser.parse_args(argv)
+    if not args.input and not args.documents:
+        parser.error("one of --input or --documents is required")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    items = load_items(args.input, args.documents, args.prompt)
+    provider = provider_from_config({"kind": args.provider, "model": args.model, "api_key": args.api_key})
+    checkpoint = Checkpoint(args.checkpoint or args.output + ".checkpoint.db")
+
+    def show_progress(finished, total):
+        print(f"\r{finished}/{total} items", end="", file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    try:
+        # The provider modules print every request and response
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            results = run_batch(items, provider, checkpoint, args.concurrency, args.max_retries, show_progress)
+    finally:
+        checkpoint.close()
+    print(file=sys.stderr)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    latencies = [result["latency"] for result in results if result["status"] == "done"]
+    summary = summarize_latencies(latencies, errors=len(results) - len(latencies))
+    summary["wall_time_s"] = round(time.perf_counter() - started, 4)
+    print(json.dumps(summary, indent=2))
+    return 0 if len(latencies) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,676 @@
+"""
+Benchmark and load-test harness for Offgrid UI.
+
+Starts a local stand-in for the Ollama `/api/chat` endpoint and an
+OpenAI-compatible `/v1/chat/completions` endpoint, drives the provider
+functions and the ChatDatabase operations under concurrency, and reports
+p50/p95/p99 latency and throughput as JSON.
+
+Usage:
+    python benchmark.py --scenario all --requests 200 --concurrency 8
+    python benchmark.py --scenario ollama --latency 0.05 --token-rate 200 --error-rate 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from latency_stats import summarize_latencies
+
+SCENARIOS = ("ollama", "openai", "db", "extraction", "coldstart", "storage", "api")
+
+
+class MockLLMConfig:
+    """Behaviour knobs for the mock LLM server"""
+
+    def __init__(self, latency=0.05, jitter=0.0, token_rate=200.0, response_tokens=64, error_rate=0.0, seed=None,
+                 models=("deepseek-r1:latest",)):
+        self.latency = latency                  # Fixed delay before the first token (seconds)
+        self.jitter = jitter                    # Extra uniform random delay (seconds)
+        self.token_rate = token_rate            # Generated tokens per second (0 disables the delay)
+        self.response_tokens = response_tokens  # Number of tokens in every answer
+        self.error_rate = error_rate            # Probability of answering with HTTP 500
+        self.models = list(models)              # Models reported by /api/tags and /api/ps
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def generation_delay(self):
+        with self.lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        delay = self.latency + extra
+        if self.token_rate:
+            delay += self.response_tokens / self.token_rate
+        return delay
+
+    def answer(self):
+        return " ".join(f"tok{i}" for i in range(self.response_tokens))
+
+
+class _MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep the benchmark output machine-readable
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self._send_body(status, "application/json", body)
+
+    def _send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, model, answer):
+        # The whole stream is sent at once; clients still have to parse it chunk by chunk
+        words = answer.split(" ")
+        pieces = [word if i == 0 else " " + word for i, word in enumerate(words)]
+        if self.path == "/api/chat":
+            lines = [{"model": model, "message": {"role": "assistant", "content": piece}, "done": False}
+                     for piece in pieces]
+            lines.append({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+            body = "".join(json.dumps(line) + "\n" for line in lines)
+            self._send_body(200, "application/x-ndjson", body.encode("utf-8"))
+        else:
+            events = [{"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                      for piece in pieces]
+            body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+            self._send_body(200, "text/event-stream", body.encode("utf-8"))
+
+    def do_GET(self):
+        config = self.server.config
+        if self.path in ("/api/tags", "/api/ps"):
+            self._send_json(200, {"models": [{"name": name, "model": name} for name in config.models]})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        config = self.server.config
+        request = self._read_json()
+
+        if self.path == "/api/generate" and not request.get("prompt"):
+            # Empty generate request: Ollama just loads the model
+            self._send_json(200, {"model": request.get("model"), "response": "", "done": True,
+                                  "done_reason": "load"})
+            return
+
+        if self.path not in ("/api/chat", "/v1/chat/completions"):
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        time.sleep(config.generation_delay())
+
+        if config.should_fail():
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        model = request.get("model", "mock")
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        answer = config.answer()
+
+        if request.get("stream"):
+            self._send_stream(model, answer)
+        elif self.path == "/api/chat":
+            self._send_json(200, {
+                "model": model,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": answer},
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": config.response_tokens
+            })
+        else:
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": config.response_tokens,
+                    "total_tokens": prompt_tokens + config.response_tokens
+                }
+            })
+
+
+class MockLLMServer:
+    """Threaded HTTP server that imitates Ollama and the OpenAI chat API"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockLLMConfig()
+        self.httpd = ThreadingHTTPServer((host, port), _MockLLMHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = self.config
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def run_load(operation, total_requests, concurrency):
+    """
+    Run `operation(i)` total_requests times on a thread pool.
+
+    Returns:
+        dict: Latency/throughput summary (see summarize_latencies)
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            operation(i)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(total_requests)))
+    wall_time = time.perf_counter() - wall_start
+
+    summary = summarize_latencies(latencies, len(errors), wall_time)
+    summary["concurrency"] = concurrency
+    if errors:
+        summary["sample_error"] = errors[0][:200]
+    return summary
+
+
+def _history(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question number {i} about the offgrid setup"})
+        history.append({"role": "assistant", "content": f"Answer number {i} with some detail " * 4})
+    return history
+
+
+def _use_mock_ollama(server, args):
+    """Point ollama_llm at the mock server, with the scheduler bound from --ollama-max-concurrent"""
+    import ollama_llm
+
+    from ollama_scheduler import OllamaScheduler
+
+    ollama_llm.OLLAMA_ENDPOINT = f"{server.base_url}/api/chat"
+    ollama_llm.OLLAMA_GENERATE_ENDPOINT = f"{server.base_url}/api/generate"
+    ollama_llm.OLLAMA_TAGS_ENDPOINT = f"{server.base_url}/api/tags"
+    ollama_llm.OLLAMA_PS_ENDPOINT = f"{server.base_url}/api/ps"
+    if args.ollama_max_concurrent:
+        ollama_llm.scheduler = OllamaScheduler(max_concurrent=args.ollama_max_concurrent,
+                                               max_per_model=args.ollama_max_concurrent)
+
+
+def bench_ollama(server, args):
+    """Drive call_ollama_llm against the mock /api/chat endpoint"""
+    import ollama_llm
+
+    _use_mock_ollama(server, args)
+    history = _history(args.history_turns)
+
+    def operation(i):
+        # Spread the load over several simulated sessions to exercise fair queueing
+        response = ollama_llm.call_ollama_llm(
+            f"Benchmark prompt {i}",
+            max_retries=args.max_retries,
+            retry_delay=args.retry_delay,
+            conversation_history=history,
+            session_id=f"bench-session-{i % args.concurrency}"
+        )
+        if not response.startswith("tok0"):
+            raise Exception(response)
+
+    return run_load(operation, args.requests, args.concurrency)
+
+
+def bench_openai(server, args):
+    """Drive call_openai_llm against the mock OpenAI-compatible endpoint"""
+    from openai_llm import call_openai_llm
+
+    os.environ["OPENAI_BASE_URL"] = f"{server.base_url}/v1"
+    history = _history(args.history_turns)
+
+    def operation(i):
+        call_openai_llm(
+            f"Benchmark prompt {i}",
+            "sk-benchmark",
+            max_retries=args.max_retries,
+            retry_delay=args.retry_delay,
+            conversation_history=history
+        )
+
+    return run_load(operation, args.requests, args.concurrency)
+
+
+def bench_db(args):
+    """Drive the ChatDatabase hot paths on a throwaway database"""
+    from model import ChatDatabase
+
+    workdir = tempfile.mkdtemp(prefix="offgrid-bench-")
+    try:
+        db = ChatDatabase(os.path.join(workdir, "bench.db"))
+        conversation_ids = [db.generate_conversation_id() for _ in range(args.conversations)]
+
+        # Seed every conversation so reads have something to do
+        for conversation_id in conversation_ids:
+            for turn in _history(args.history_turns):
+                db.save_message(turn["role"], turn["content"], conversation_id)
+
+        results = {}
+        results["save_message"] = run_load(
+            lambda i: db.save_message("user", f"Benchmark message {i}", conversation_ids[i % len(conversation_ids)]),
+            args.requests, args.concurrency
+        )
+        results["get_conversation_messages"] = run_load(
+            lambda i: db.get_conversation_messages(conversation_ids[i % len(conversation_ids)]),
+            args.requests, args.concurrency
+        )
+        results["get_all_conversations"] = run_load(
+            lambda i: db.get_all_conversations(),
+            args.requests, args.concurrency
+        )
+
+        def render_sidebar(i):
+            # Mirrors the sidebar in app.py: list conversations with their titles, then prefetch the recent ones
+            conversations = db.get_all_conversations()
+            recent = sorted(conversations, key=lambda conv: conv["last_updated"], reverse=True)
+            db.prefetch_conversations([conv["conversation_id"] for conv in recent[:5]])
+
+        results["sidebar_render"] = run_load(render_sidebar, max(1, args.requests // 10), args.concurrency)
+
+        def load_uncached(i):
+            # A conversation that is neither cached nor prefetched, as on the first visit
+            conversation_id = conversation_ids[i % len(conversation_ids)]
+            db._invalidate(conversation_id)
+            db.get_conversation_messages(conversation_id)
+
+        results["get_conversation_messages_uncached"] = run_load(load_uncached, args.requests, args.concurrency)
+        db.engine.dispose()
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_extraction(args):
+    """Drive document extraction on --document, or on a generated text file"""
+    from documents import extract_document
+
+    if args.document:
+        file_name = os.path.basename(args.document)
+        with open(args.document, "rb") as f:
+            data = f.read()
+    else:
+        file_name = "generated.txt"
+        data = "\n".join(f"Line {i} of the generated benchmark document" for i in range(20000)).encode("utf-8")
+
+    result = run_load(lambda i: extract_document(file_name, "", data), args.requests, args.concurrency)
+    result["document"] = file_name
+    result["document_bytes"] = len(data)
+    return result
+
+
+def bench_api(server, args):
+    """Drive the headless API server (api_server.py) over HTTP, backed by the mock Ollama endpoint"""
+    import asyncio
+
+    import providers
+    import requests
+    from aiohttp import web
+
+    from api_server import DB_KEY, create_app
+    from model import ChatDatabase
+    from rate_limit import RateLimiter
+
+    _use_mock_ollama(server, args)
+    # Measure the engine, not the configured rate limits
+    rate_limiter = providers.rate_limiter
+    providers.rate_limiter = RateLimiter(session_rpm=0, key_rpm=0, provider_rpm=0)
+
+    workdir = tempfile.mkdtemp(prefix="offgrid-bench-")
+    loop = asyncio.new_event_loop()
+    app = create_app(ChatDatabase(os.path.join(workdir, "bench.db")), workers=max(4, args.concurrency * 2))
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    host, port = runner.addresses[0][:2]
+    base_url = f"http://{host}:{port}"
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    try:
+        conversation_ids = [
+            requests.post(f"{base_url}/v1/conversations").json()["conversation_id"]
+            for _ in range(args.concurrency)
+        ]
+
+        def send(i, stream):
+            # One simulated client per conversation, each with its own session for rate limiting
+            response = requests.post(
+                f"{base_url}/v1/conversations/{conversation_ids[i % len(conversation_ids)]}/messages",
+                json={"prompt": f"Benchmark prompt {i}", "provider": {"kind": "ollama"}, "stream": stream},
+                headers={"X-Session-Id": f"bench-session-{i}"},
+                stream=stream
+            )
+            if response.status_code != 200:
+                raise Exception(f"HTTP {response.status_code}: {response.text[:200]}")
+            if stream:
+                events = [line for line in response.iter_lines() if line.startswith(b"event: ")]
+                if events[-1] != b"event: done":
+                    raise Exception(f"Stream ended with {events[-1]!r}")
+
+        return {
+            "message": run_load(lambda i: send(i, False), args.requests, args.concurrency),
+            "message_stream": run_load(lambda i: send(i, True), args.requests, args.concurrency),
+            "list_conversations": run_load(
+                lambda i: requests.get(f"{base_url}/v1/conversations").raise_for_status(),
+                args.requests, args.concurrency
+            )
+        }
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        app[DB_KEY].engine.dispose()
+        providers.rate_limiter = rate_limiter
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+_WORDS = ("the", "model", "answer", "offgrid", "server", "local", "request", "file", "data", "python", "value",
+          "config", "memory", "latency", "token", "user", "response", "database", "install", "error", "and", "of",
+          "to", "in", "is", "for", "with", "you", "can", "this", "a", "run", "check", "set", "use", "step")
+
+
+def _storage_corpus(args):
+    """Turns shaped like real chats: short questions, long Markdown answers and pasted documents"""
+    from prompt_builder import build_user_turn
+
+    rng = random.Random(args.seed)
+
+    def paragraph(words):
+        return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+    def answer():
+        parts = [f"## {paragraph(4)}"]
+        for step in range(1, rng.randint(3, 8)):
+            parts.append(f"{step}. **{paragraph(3)}** {paragraph(rng.randint(20, 80))}")
+        parts.append("```python\nfor i in range(10):\n    print(f\"value {i}\")\n```")
+        return "\n\n".join(parts)
+
+    if args.document:
+        from documents import extract_document
+        with open(args.document, "rb") as f:
+            document = extract_document(os.path.basename(args.document), "", f.read())
+    else:
+        document = "\n".join(paragraph(rng.randint(10, 30)) for _ in range(150))
+
+    turns = []
+    for i in range(args.history_turns):
+        question = paragraph(rng.randint(5, 25))
+        # Every third question comes with the document, as uploads do
+        llm_content = build_user_turn(question, "notes.txt", document) if i % 3 == 0 else None
+        turns.append(("user", question, llm_content))
+        turns.append(("assistant", answer(), None))
+    return turns
+
+
+def bench_storage(args):
+    """Database size and read latency with each compression setting, on the same corpus"""
+    import compression
+    from model import ChatDatabase
+
+    codecs = ["none", "zlib"]
+    if compression._zstd() is not None:
+        codecs.append("zstd")
+
+    turns = _storage_corpus(args)
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="offgrid-bench-")
+    configured = compression.COMPRESSION
+    try:
+        for codec in codecs:
+            compression.COMPRESSION = codec
+            path = os.path.join(workdir, f"{codec}.db")
+            db = ChatDatabase(path)
+            conversation_ids = [db.generate_conversation_id() for _ in range(args.conversations)]
+            for conversation_id in conversation_ids:
+                for role, content, llm_content in turns:
+                    db.save_message(role, content, conversation_id, llm_content=llm_content)
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql("VACUUM")
+
+            results[codec] = {
+                "db_bytes": os.path.getsize(path),
+                # Straight from the database: get_conversation_messages would mostly measure cache hits
+                "load_conversation": run_load(
+                    lambda i: db._load_conversation(conversation_ids[i % len(conversation_ids)]),
+                    args.requests, args.concurrency
+                ),
+                # The prompt-building read, the only one that decodes llm_content
+                "conversation_history": run_load(
+                    lambda i: db.get_conversation_history(conversation_ids[i % len(conversation_ids)]),
+                    args.requests, args.concurrency
+                )
+            }
+            db.engine.dispose()
+    finally:
+        compression.COMPRESSION = configured
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for codec in codecs:
+        results[codec]["size_ratio"] = round(results[codec]["db_bytes"] / results["none"]["db_bytes"], 3)
+    results["threshold_chars"] = compression.COMPRESSION_THRESHOLD
+    return results
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Runs the Streamlit script headlessly: one cold run (imports included), then reruns
+_COLDSTART_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_import = time.perf_counter() - start
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+start = time.perf_counter()
+at.run()
+first_run = time.perf_counter() - start
+reruns = []
+for _ in range(int(sys.argv[2])):
+    start = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - start)
+print(json.dumps({
+    "streamlit_import_s": streamlit_import,
+    "first_run_s": first_run,
+    "rerun_s": reruns,
+    "exceptions": [str(e.value) for e in at.exception]
+}))
+"""
+
+
+def profile_imports(env, top=15):
+    """Import-time profile (python -X importtime) of app.py's direct imports, slowest first"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=os.path.dirname(APP_PATH), env=env, capture_output=True, text=True
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name[1:]
+        # Nesting is shown by two spaces per level; keep the modules imported directly by app.py
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        if depth != 1:
+            continue
+        imports.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    imports.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return imports[:top]
+
+
+def bench_coldstart(args):
+    """Measure cold start and rerun time of the Streamlit script on a throwaway database"""
+    workdir = tempfile.mkdtemp(prefix="offgrid-bench-")
+    try:
+        env = dict(os.environ, OFFGRID_DB_PATH=os.path.join(workdir, "bench.db"))
+        first_runs, reruns, import_times, process_times = [], [], [], []
+        exceptions = []
+        for _ in range(args.coldstart_runs):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", _COLDSTART_SCRIPT, APP_PATH, str(args.reruns)],
+                cwd=os.path.dirname(APP_PATH), env=env, capture_output=True, text=True
+            )
+            process_times.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                raise Exception(f"Cold start run failed: {result.stderr[-500:]}")
+            run = json.loads(result.stdout.strip().splitlines()[-1])
+            first_runs.append(run["first_run_s"])
+            import_times.append(run["streamlit_import_s"])
+            reruns.extend(run["rerun_s"])
+            exceptions.extend(run["exceptions"])
+
+        return {
+            # Interpreter start to exit of each process, including the reruns
+            "process_wall": summarize_latencies(process_times),
+            "streamlit_import": summarize_latencies(import_times),
+            "first_run": summarize_latencies(first_runs),
+            "rerun": summarize_latencies(reruns),
+            "app_exceptions": exceptions[:5],
+            "import_profile": profile_imports(env)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmarks(args):
+    """Run the selected scenarios and return the JSON-serialisable report"""
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    config = MockLLMConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "settings": vars(args),
+        "results": {}
+    }
+
+    # The provider modules print every request/response; keep stdout clean for the report
+    with MockLLMServer(config) as server, contextlib.redirect_stdout(io.StringIO()):
+        for scenario in scenarios:
+            if scenario == "ollama":
+                report["results"]["ollama"] = bench_ollama(server, args)
+            elif scenario == "openai":
+                report["results"]["openai"] = bench_openai(server, args)
+            elif scenario == "db":
+                report["results"]["db"] = bench_db(args)
+            elif scenario == "extraction":
+                report["results"]["extraction"] = bench_extraction(args)
+            elif scenario == "coldstart":
+                report["results"]["coldstart"] = bench_coldstart(args)
+            elif scenario == "storage":
+                report["results"]["storage"] = bench_storage(args)
+            elif scenario == "api":
+                report["results"]["api"] = bench_api(server, args)
+
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offgrid UI benchmark and load-test suite")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per measured operation")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent worker threads")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server base latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mock server random extra latency in seconds")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Mock tokens generated per second")
+    parser.add_argument("--response-tokens", type=int, default=64, help="Tokens in each mock answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected HTTP 500")
+    parser.add_argument("--max-retries", type=int, default=0, help="max_retries passed to the provider calls")
+    parser.add_argument("--retry-delay", type=float, default=0.0, help="retry_delay passed to the provider calls")
+    parser.add_argument("--ollama-max-concurrent", type=int, default=None,
+                        help="Override the Ollama scheduler's concurrency bound (default: its configured value)")
+    parser.add_argument("--history-turns", type=int, default=5, help="Prior turns in each conversation")
+    parser.add_argument("--conversations", type=int, default=20, help="Conversations seeded for the db and storage scenarios")
+    parser.add_argument("--document", help="File to extract in the extraction scenario (default: generated text)")
+    parser.add_argument("--coldstart-runs", type=int, default=3, help="Fresh interpreter runs in the coldstart scenario")
+    parser.add_argument("--reruns", type=int, default=5, help="Reruns measured after each cold start")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for error injection")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
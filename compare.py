@@ -0,0 +1,85 @@
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from providers import estimate_tokens
+
+
+def _timed_stream(provider, index, prompt, conversation_history, images, events):
+    """Stream one provider's answer, putting ("chunk", index, text) events and then its ("result", index, result)"""
+    start = time.perf_counter()
+    chunks = []
+    try:
+        kwargs = {"images": images} if images else {}
+        for chunk in provider.stream(prompt, conversation_history=conversation_history, **kwargs):
+            if chunk:
+                chunks.append(chunk)
+                events.put(("chunk", index, chunk))
+        response = "".join(chunks)
+        if not response:
+            raise ValueError(f"{provider.name} returned an empty answer")
+        error = None
+    except Exception as e:
+        logging.error(f"Compare mode: {provider.name} failed: {str(e)}")
+        response = None
+        error = str(e)
+    latency = time.perf_counter() - start
+
+    tokens = estimate_tokens(response)
+    events.put(("result", index, {
+        "provider": provider.name,
+        "response": response,
+        "error": error,
+        "latency": latency,
+        "tokens": tokens,
+        "tokens_per_second": tokens / latency if response and latency > 0 else None
+    }))
+
+
+def compare_providers(providers, prompt, conversation_history=None, on_result=None, images=None, on_chunk=None):
+    """
+    Send one prompt to several providers at once.
+
+    Every provider streams its answer on its own worker thread, so the total
+    time is that of the slowest provider rather than the sum of all of them.
+    The callbacks run in the calling thread (safe for Streamlit elements).
+
+    Args:
+        providers (list): Provider objects (see providers.py)
+        prompt (str): The prompt to send
+        conversation_history (list): History shared by all providers
+        on_result (callable): Called as on_result(index, result) as soon as
+            each provider finishes
+        images (list): Base64 JPEG images attached to the prompt
+        on_chunk (callable): Called as on_chunk(index, answer_so_far) for every
+            chunk a provider streams
+
+    Returns:
+        list: One result dict per provider, in the same order as `providers`,
+            with keys provider, response, error, latency, tokens, tokens_per_second
+    """
+    results = [None] * len(providers)
+    if not providers:
+        return results
+
+    events = queue.Queue()
+    answers = [""] * len(providers)
+    with ThreadPoolExecutor(max_workers=len(providers)) as executor:
+        for index, provider in enumerate(providers):
+            executor.submit(_timed_stream, provider, index, prompt, conversation_history, images, events)
+
+        remaining = len(providers)
+        while remaining:
+            kind, index, value = events.get()
+            if kind == "chunk":
+                answers[index] += value
+                if on_chunk:
+                    on_chunk(index, answers[index])
+                continue
+            results[index] = value
+            remaining -= 1
+            if on_result:
+                on_result(index, value)
+
+    return results
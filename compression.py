@@ -0,0 +1,111 @@
+"""
+Transparent compression of long message text.
+
+Text longer than COMPRESSION_THRESHOLD characters is stored as a compressed
+blob. Every blob starts with a one-byte codec tag, so rows written with
+different settings can always be read back. zlib is always available; zstd
+is used when the `zstandard` package is installed and OFFGRID_COMPRESSION is
+set to "zstd".
+
+Both codecs are primed with a preset dictionary of text that recurs in chat
+histories (the document prompt template, Markdown and code fragments), which
+helps most on the short-to-medium answers that make up the bulk of the data.
+The dictionary is part of the storage format: never edit it in place, add a
+new codec tag with a new dictionary instead.
+"""
+import os
+import zlib
+
+# "zlib", "zstd" or "none"
+COMPRESSION = os.environ.get("OFFGRID_COMPRESSION", "zlib").lower()
+# Shorter text is stored as is: below this the dictionary and headers eat most of the gain
+COMPRESSION_THRESHOLD = int(os.environ.get("OFFGRID_COMPRESSION_THRESHOLD", "1024"))
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+# Leading characters kept uncompressed next to each blob (titles, previews, search)
+PREVIEW_CHARS = 200
+
+_TAG_ZLIB_V1 = b"\x01"
+_TAG_ZSTD_V1 = b"\x02"
+
+# Preset dictionary, version 1. zlib only uses the last 32 KiB and gives the
+# end of the dictionary the shortest distances, so the most common strings go last.
+_DICTIONARY_V1 = "\n".join([
+    "import numpy as np", "import pandas as pd", "def __init__(self", "return None", "if __name__ == \"__main__\":",
+    "for i in range(", "except Exception as e:", "print(f\"", "console.log(", "function ", "const ", "=> {",
+    "```python\n", "```javascript\n", "```bash\n", "```json\n", "```\n",
+    "| --- | --- |", "**Note:**", "### ", "## ", "1. ", "2. ", "3. ", "- **",
+    " the ", " and ", " of the ", " in the ", " to the ", " for the ", " that ", " this ", " with ", " you ",
+    " can ", " is ", " are ", " be ", " it ", " on ", " as ", " or ", " which ", " will ", " should ",
+    "For example, ", "However, ", "In summary, ", "Here is ", "Here's ", "Let me know if you ",
+    "I hope this helps", "If you have any other questions", "feel free to ask", "Sure! ", "Certainly! ",
+    "<think>\n", "</think>\n\n",
+    "The user has uploaded a file (", ") with the following content:\n\nFILE CONTENT:\n",
+    "\n[Content truncated due to length...]",
+    "\n\nUSER QUERY:\n",
+    "\n\nPlease respond to the user's query based on the file content.",
+    "The user has uploaded an image. ", "[File attached: ",
+]).encode("utf-8")
+
+_zstd_dict = None
+
+
+def _zstd():
+    """The zstandard module, or None when it isn't installed"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _zstd_dictionary(zstandard):
+    global _zstd_dict
+    if _zstd_dict is None:
+        _zstd_dict = zstandard.ZstdCompressionDict(_DICTIONARY_V1, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    return _zstd_dict
+
+
+def compress_text(text):
+    """
+    Compress `text` if it is long enough to be worth it.
+
+    Returns:
+        bytes: The tagged blob, or None when the text should be stored as is
+    """
+    if text is None or COMPRESSION == "none" or len(text) < COMPRESSION_THRESHOLD:
+        return None
+    data = text.encode("utf-8")
+
+    zstandard = _zstd() if COMPRESSION == "zstd" else None
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_zstd_dictionary(zstandard))
+        blob = _TAG_ZSTD_V1 + compressor.compress(data)
+    else:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=_DICTIONARY_V1)
+        blob = _TAG_ZLIB_V1 + compressor.compress(data) + compressor.flush()
+
+    # Incompressible text (e.g. base64) is cheaper to keep as plain text
+    return blob if len(blob) < len(data) else None
+
+
+def decompress_text(blob):
+    """Decode a blob written by compress_text()"""
+    tag, payload = blob[:1], blob[1:]
+    if tag == _TAG_ZLIB_V1:
+        decompressor = zlib.decompressobj(zdict=_DICTIONARY_V1)
+        data = decompressor.decompress(payload) + decompressor.flush()
+    elif tag == _TAG_ZSTD_V1:
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("This message was compressed with zstd; install the 'zstandard' package to read it")
+        data = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary(zstandard)).decompress(payload)
+    else:
+        raise ValueError(f"Unknown compression tag {tag!r}")
+    return data.decode("utf-8")
+
+
+def preview(text):
+    """Uncompressed leading part of a long text"""
+    return text[:PREVIEW_CHARS]
@@ -0,0 +1,68 @@
+"""
+Versioned in-memory cache of conversations.
+
+Every conversation has a version that only ever increases. ChatDatabase
+keeps it in the conversation_versions table and bumps it in the same
+transaction as every write, so all processes using the database see the
+same versions. A cached conversation is served only while the version it
+was read at is still current, so hot reads skip loading the messages
+without ever returning stale ones.
+
+Cached messages are immutable (a tuple of read-only mappings), so every
+reader - all Streamlit sessions, API workers and threads in the process -
+gets the same objects without copying.
+"""
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+
+def freeze_messages(messages):
+    """Make message dicts safe to share: a tuple of read-only mappings"""
+    return tuple(MappingProxyType(dict(message)) for message in messages)
+
+
+class ConversationCache:
+    """LRU of frozen conversations, each remembered with the version it was read at"""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()  # conversation_id -> (version, messages), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id, version):
+        """The cached messages if they were read at `version` (the current one), else None"""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                if entry[0] < version:
+                    del self._entries[conversation_id]
+                return None
+            self._entries.move_to_end(conversation_id)
+            return entry[1]
+
+    def store(self, conversation_id, version, messages):
+        """
+        Cache frozen messages read at `version`.
+
+        Read the version before loading the messages: a write in between then
+        only makes the entry look stale, it never hides newer messages.
+        """
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None and entry[0] > version:
+                return
+            self._entries[conversation_id] = (version, messages)
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, conversation_id=None):
+        """Drop a conversation (or, with None, all of them) from memory"""
+        with self._lock:
+            if conversation_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(conversation_id, None)
@@ -0,0 +1,249 @@
+"""
+Document text extraction for uploaded files.
+
+Large PDFs are split into page ranges that are extracted in a process pool
+and reassembled in page order; multi-sheet Excel workbooks have every sheet
+read concurrently. Each document gets an overall time limit, and progress is
+reported through a callback so the UI can show it.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+# Seconds allowed for extracting a single document
+DOCUMENT_TIME_LIMIT = 120
+# PDFs with fewer pages than this are extracted in-process (pool start-up isn't worth it)
+PARALLEL_PAGE_THRESHOLD = 8
+# Pages handed to a worker at a time; each worker re-parses the PDF, so keep ranges coarse
+PAGES_PER_TASK = 16
+
+EXCEL_TYPES = ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "application/vnd.ms-excel"]
+WORD_TYPES = ["application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/msword"]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Shared worker pool, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' avoids forking the multi-threaded Streamlit server
+            _pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _parallel_enabled():
+    """A worker pool only pays off with more than one core"""
+    return (os.cpu_count() or 1) > 1
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _extract_pdf_pages(data, start, end):
+    """Worker: extract the text of pages [start, end) of a PDF"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(BytesIO(data))
+    return [reader.pages[page_num].extract_text() or "" for page_num in range(start, end)]
+
+
+def _read_excel_sheet(data, sheet_name):
+    """Worker: render one sheet of an Excel workbook as text"""
+    import pandas as pd
+
+    return pd.read_excel(BytesIO(data), sheet_name=sheet_name).to_string()
+
+
+def _run_parallel(tasks, deadline, progress=None, weights=None):
+    """
+    Run (function, args) tasks in the process pool until the deadline.
+
+    Returns:
+        dict: task index -> result, for the tasks that finished in time
+    """
+    results = {}
+    weights = weights or [1] * len(tasks)
+    total = sum(weights)
+    done = 0
+
+    pool = _get_pool()
+    futures = {pool.submit(function, *args): index for index, (function, args) in enumerate(tasks)}
+    try:
+        for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+            index = futures[future]
+            results[index] = future.result()
+            done += weights[index]
+            if progress:
+                progress(done, total)
+    except FuturesTimeoutError:
+        for future in futures:
+            future.cancel()
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    return results
+
+
+def _pdf_metadata_notice(pdf_reader):
+    metadata = ""
+    if pdf_reader.metadata:
+        for key, value in pdf_reader.metadata.items():
+            if key and value and str(value).strip():
+                clean_key = str(key).replace('/', '')
+                metadata += f"{clean_key}: {value}\n"
+
+    if metadata:
+        return f"[This appears to be a scanned or image-based PDF without extractable text. PDF Metadata:\n{metadata}\n\nConsider using an OCR tool to extract text from the PDF before uploading.]"
+    return "[This appears to be a scanned or image-based PDF without extractable text. Consider using an OCR tool to extract text from the PDF before uploading.]"
+
+
+def extract_pdf(data, progress=None, time_limit=DOCUMENT_TIME_LIMIT):
+    """Extract the text of a PDF, page by page, in page order"""
+    import PyPDF2
+
+    deadline = time.monotonic() + time_limit
+    print(f"Processing PDF file, Size: {len(data)} bytes")
+    try:
+        pdf_reader = PyPDF2.PdfReader(BytesIO(data))
+        page_count = len(pdf_reader.pages)
+
+        # Check if the PDF has any pages
+        if page_count == 0:
+            return "[PDF appears to be empty or corrupted]"
+
+        pages = {}
+        if page_count < PARALLEL_PAGE_THRESHOLD or not _parallel_enabled():
+            for page_num in range(page_count):
+                if time.monotonic() > deadline:
+                    break
+                pages[page_num] = pdf_reader.pages[page_num].extract_text() or ""
+                if progress:
+                    progress(page_num + 1, page_count)
+        else:
+            ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+            try:
+                chunks = _run_parallel(
+                    [(_extract_pdf_pages, (data, start, end)) for start, end in ranges],
+                    deadline,
+                    progress,
+                    weights=[end - start for start, end in ranges]
+                )
+            except BrokenProcessPool as e:
+                logging.error(f"PDF worker pool failed, extracting serially: {str(e)}")
+                chunks = {0: _extract_pdf_pages(data, 0, page_count)}
+                ranges = [(0, page_count)]
+            # Reassemble in page order
+            for index, texts in chunks.items():
+                start = ranges[index][0]
+                for offset, page_text in enumerate(texts):
+                    pages[start + offset] = page_text
+
+        file_content = ""
+        for page_num in sorted(pages):
+            page_text = pages[page_num]
+            if page_text.strip():  # Check if extracted text is not empty
+                file_content += f"--- Page {page_num + 1} ---\n{page_text}\n\n"
+
+        # If no text was extracted (possibly a scanned/image PDF)
+        if not file_content.strip() and len(pages) == page_count:
+            return _pdf_metadata_notice(pdf_reader)
+
+        if len(pages) < page_count:
+            missing = [str(page_num + 1) for page_num in range(page_count) if page_num not in pages]
+            file_content += f"[Extraction stopped after {time_limit}s; pages not processed: {', '.join(missing)}]"
+        return file_content
+    except Exception as pdf_error:
+        print(f"PDF extraction error: {str(pdf_error)}")
+        return f"[Error extracting PDF content: {str(pdf_error)}. File size: {len(data)} bytes. The PDF might be password-protected, corrupted, or in an unsupported format.]"
+
+
+def extract_excel(data, progress=None, time_limit=DOCUMENT_TIME_LIMIT):
+    """Extract every sheet of an Excel workbook; sheets are read concurrently"""
+    import pandas as pd
+
+    deadline = time.monotonic() + time_limit
+    sheet_names = pd.ExcelFile(BytesIO(data)).sheet_names
+
+    if len(sheet_names) <= 1:
+        file_content = pd.read_excel(BytesIO(data)).to_string()
+        if progress:
+            progress(1, 1)
+        return file_content
+
+    sheets = {}
+    if _parallel_enabled():
+        try:
+            sheets = _run_parallel([(_read_excel_sheet, (data, name)) for name in sheet_names], deadline, progress)
+        except BrokenProcessPool as e:
+            logging.error(f"Excel worker pool failed, reading serially: {str(e)}")
+    if not sheets:
+        for index, name in enumerate(sheet_names):
+            if time.monotonic() > deadline:
+                break
+            sheets[index] = _read_excel_sheet(data, name)
+            if progress:
+                progress(index + 1, len(sheet_names))
+
+    parts = []
+    for index, name in enumerate(sheet_names):
+        if index in sheets:
+            parts.append(f"--- Sheet: {name} ---\n{sheets[index]}")
+        else:
+            parts.append(f"--- Sheet: {name} ---\n[Not processed: extraction stopped after {time_limit}s]")
+    return "\n\n".join(parts)
+
+
+def extract_document(file_name, file_type, data, progress=None, time_limit=DOCUMENT_TIME_LIMIT):
+    """
+    Extract the text of an uploaded document.
+
+    Args:
+        file_name (str): Name of the uploaded file
+        file_type (str): MIME type reported by the browser
+        data (bytes): The file contents
+        progress (callable): Called as progress(done, total) as work completes
+        time_limit (float): Seconds allowed before extraction stops with partial results
+
+    Returns:
+        str: The extracted text, or a bracketed note explaining why there is none
+    """
+    if file_type == "text/plain" or file_name.endswith(".txt"):
+        # For text files
+        return data.decode("utf-8")
+    elif file_type == "application/pdf" or file_name.endswith(".pdf"):
+        # For PDF files - requires PyPDF2
+        return extract_pdf(data, progress, time_limit)
+    elif file_type in EXCEL_TYPES or file_name.endswith((".xlsx", ".xls")):
+        # For Excel files - requires pandas
+        return extract_excel(data, progress, time_limit)
+    elif file_type == "text/csv" or file_name.endswith(".csv"):
+        # For CSV files - requires pandas
+        import pandas as pd
+        return pd.read_csv(BytesIO(data)).to_string()
+    elif file_type in WORD_TYPES or file_name.endswith((".docx", ".doc")):
+        # For Word files - requires python-docx
+        import docx
+        doc = docx.Document(BytesIO(data))
+        return "\n".join([para.text for para in doc.paragraphs])
+    else:
+        # For other file types, try to read as text or inform user
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            return "[File content could not be extracted. Unsupported file type.]"
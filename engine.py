@@ -0,0 +1,223 @@
+"""
+The chat engine without a user interface.
+
+Everything a chat turn needs - history assembly, document context, image
+preparation, provider dispatch and persistence - behind plain function
+calls, so it can be driven by the Streamlit app, the HTTP API server
+(api_server.py) or a script. Nothing here touches Streamlit.
+"""
+import base64
+import os
+import time
+import uuid
+
+from compare import compare_providers
+from image_pipeline import prepare_image
+from ingestion import wait_for_ingestion
+from prompt_builder import build_conversation_history, build_user_turn
+from providers import openai_provider, replicate_provider, ollama_provider
+from routing import route_request, route_request_with_draft
+
+PROVIDER_KINDS = ("openai", "replicate", "ollama")
+
+
+def provider_from_config(config, session_id=None, on_usage=None):
+    """
+    Build a Provider from a plain description, e.g. {"kind": "ollama", "model": "llama3"}.
+
+    API keys default to the OPENAI_API_KEY / REPLICATE_API_TOKEN environment variables.
+
+    Raises:
+        ValueError: For an unknown kind or a missing API key
+    """
+    kind = config.get("kind")
+    if kind == "ollama":
+        from ollama_llm import DEFAULT_OLLAMA_MODEL
+        return ollama_provider(config.get("model") or DEFAULT_OLLAMA_MODEL, session_id=session_id, on_usage=on_usage)
+    if kind == "openai":
+        api_key = config.get("api_key") or os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("An OpenAI API key is required")
+        return openai_provider(api_key, session_id=session_id, on_usage=on_usage)
+    if kind == "replicate":
+        api_key = config.get("api_key") or os.environ.get("REPLICATE_API_TOKEN")
+        if not api_key:
+            raise ValueError("A Replicate API key is required")
+        return replicate_provider(api_key, config.get("model") or "meta/meta-llama-3-70b-instruct",
+                                  session_id=session_id, on_usage=on_usage)
+    raise ValueError(f"Unknown provider kind {kind!r}, expected one of {', '.join(PROVIDER_KINDS)}")
+
+
+class ChatEngine:
+    """Runs chat turns against a ChatDatabase"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def prepare_turn(self, conversation_id, prompt, document_hash=None, image_data=None, image_name=None,
+                     on_progress=None):
+        """
+        Save the user's message and assemble what the provider needs.
+
+        Args:
+            conversation_id (str): Conversation the turn belongs to
+            prompt (str): The user's message
+            document_hash (str): An ingested document (see ingestion.py) to answer from
+            image_data (str): Base64 image attached to the message
+            image_name (str): File name of the image, shown with the message
+            on_progress (callable): Called as on_progress(job) while waiting for the document
+
+        Returns:
+            dict: llm_prompt, conversation_history and images to send to a provider
+
+        Raises:
+            ValueError: For an unknown, failed or unfinished document
+        """
+        # History as the model saw it, read before this turn is added
+        conversation_history = build_conversation_history(self.db.get_conversation_history(conversation_id))
+
+        user_message = prompt
+        llm_prompt = prompt
+        if document_hash:
+            job = wait_for_ingestion(self.db, document_hash, on_progress=on_progress)
+            if job is None:
+                raise ValueError(f"Unknown document {document_hash}")
+            if job["status"] != "done":
+                raise ValueError(f"Document {job['file_name']} is not ready: {job['error'] or job['status']}")
+            self.db.attach_document(conversation_id, document_hash)
+            user_message = f"[File attached: {job['file_name']}]\n\n{prompt}"
+            llm_prompt = build_user_turn(prompt, job["file_name"], job["content"])
+
+        images = None
+        if image_data:
+            images = [prepare_image(base64.b64decode(image_data))["model_data"]]
+            if image_name:
+                user_message = f"[File attached: {image_name}]\n\n{prompt}"
+
+        self.db.save_message(
+            "user",
+            user_message,
+            conversation_id,
+            image_data,
+            llm_content=llm_prompt if llm_prompt != user_message else None
+        )
+        return {"llm_prompt": llm_prompt, "conversation_history": conversation_history, "images": images}
+
+    def send_message(self, conversation_id, prompt, provider, fallbacks=None, document_hash=None, image_data=None,
+                     hedge_percentile=None, draft_provider=None, on_draft=None, **turn_kwargs):
+        """
+        Run one chat turn and store both sides of it.
+
+        Args:
+            provider (Provider): Backend to answer with
+            fallbacks (list): Providers to fail over to (see routing.route_request)
+            hedge_percentile (float): Hedge slow requests to the first fallback at this latency percentile
+            draft_provider (Provider): Streams a throwaway draft through on_draft while
+                waiting (see routing.route_request_with_draft)
+            on_draft (callable): Called as on_draft(draft_so_far) for every draft chunk
+            **turn_kwargs: Passed on to prepare_turn (image_name, on_progress)
+
+        Returns:
+            dict: The saved assistant message: id, role, content, conversation_id, provider and latency
+        """
+        turn = self.prepare_turn(conversation_id, prompt, document_hash, image_data, **turn_kwargs)
+
+        route_kwargs = {
+            "conversation_history": turn["conversation_history"],
+            "fallbacks": fallbacks,
+            "hedge_percentile": hedge_percentile,
+            "images": turn["images"]
+        }
+        if draft_provider is not None:
+            result = route_request_with_draft(provider, turn["llm_prompt"], draft_provider, on_draft, **route_kwargs)
+        elif fallbacks:
+            result = route_request(provider, turn["llm_prompt"], **route_kwargs)
+        else:
+            started = time.perf_counter()
+            response = provider(turn["llm_prompt"], conversation_history=turn["conversation_history"],
+                                images=turn["images"])
+            result = {"provider": provider.name, "response": response, "latency": time.perf_counter() - started}
+
+        return self.save_answer(conversation_id, result["response"], result["provider"], result["latency"])
+
+    def compare_message(self, conversation_id, prompt, providers, on_result=None, document_hash=None,
+                        image_data=None, on_chunk=None, **turn_kwargs):
+        """
+        Send one turn to several providers at once and store every answer.
+
+        The answers are saved as one group (sharing a group_id), which the app
+        shows side by side. A provider that fails is left out of the group.
+
+        Args:
+            providers (list): Providers to compare
+            on_result (callable): Called as on_result(index, result) as each provider finishes
+            on_chunk (callable): Called as on_chunk(index, answer_so_far) as each answer streams in
+            **turn_kwargs: Passed on to prepare_turn (image_name, on_progress)
+
+        Returns:
+            list: One compare_providers result per provider, in order
+        """
+        turn = self.prepare_turn(conversation_id, prompt, document_hash, image_data, **turn_kwargs)
+        results = compare_providers(
+            providers,
+            turn["llm_prompt"],
+            turn["conversation_history"],
+            on_result=on_result,
+            images=turn["images"],
+            on_chunk=on_chunk
+        )
+
+        group_id = str(uuid.uuid4())
+        for result in results:
+            if result["response"]:
+                self.save_answer(conversation_id, result["response"], result["provider"], result["latency"],
+                                 group_id=group_id)
+        return results
+
+    def stream_message(self, conversation_id, prompt, provider, document_hash=None, image_data=None):
+        """
+        Like send_message, but yields the answer in chunks as it is generated.
+
+        The answer is saved when the stream completes; a stream that fails or
+        is closed early saves nothing.
+
+        Yields:
+            tuple: ("token", piece of the answer) for each chunk, then
+                ("done", the saved assistant message)
+        """
+        turn = self.prepare_turn(conversation_id, prompt, document_hash, image_data)
+
+        started = time.perf_counter()
+        chunks = []
+        for chunk in provider.stream(turn["llm_prompt"], conversation_history=turn["conversation_history"],
+                                     images=turn["images"]):
+            chunks.append(chunk)
+            yield "token", chunk
+
+        yield "done", self.save_answer(conversation_id, "".join(chunks), provider.name, time.perf_counter() - started)
+
+    def save_answer(self, conversation_id, response, provider_name, latency, group_id=None):
+        """
+        Store an assistant answer.
+
+        Returns:
+            dict: The saved message: id, role, content, conversation_id, provider and latency
+        """
+        if not response:
+            raise Exception(f"{provider_name} returned an empty response")
+        message_id = self.db.save_message(
+            "assistant",
+            response,
+            conversation_id,
+            provider=provider_name,
+            group_id=group_id,
+            latency=latency
+        )
+        return {
+            "id": message_id,
+            "role": "assistant",
+            "content": response,
+            "conversation_id": conversation_id,
+            "provider": provider_name,
+            "latency": latency
+        }
@@ -0,0 +1,87 @@
+"""
+Image preprocessing for uploads.
+
+Each uploaded image is converted once into a bounded-resolution JPEG for
+model input and a small WebP thumbnail for display. Results are cached by
+content hash, and stored alongside the original in the images table.
+"""
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+# Longest side of the image sent to vision models; larger inputs only add tokens and decode time
+MODEL_MAX_SIDE = 1024
+MODEL_JPEG_QUALITY = 85
+# Longest side of the thumbnail shown in the chat
+THUMBNAIL_MAX_SIDE = 320
+THUMBNAIL_WEBP_QUALITY = 75
+
+MODEL_MIME_TYPE = "image/jpeg"
+THUMBNAIL_MIME_TYPE = "image/webp"
+
+_CACHE_SIZE = 32
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def content_hash(data):
+    """SHA-256 hex digest of the original image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _resized(image, max_side):
+    image = image.copy()
+    image.thumbnail((max_side, max_side))
+    return image
+
+
+def _encode(image, image_format, **save_options):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **save_options)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def prepare_image(data):
+    """
+    Produce the model-input and thumbnail versions of an uploaded image.
+
+    Args:
+        data (bytes): The original image file
+
+    Returns:
+        dict: content_hash, model_data (base64 JPEG), model_mime_type,
+            thumbnail_data (base64 WebP) and thumbnail_mime_type
+    """
+    digest = content_hash(data)
+    with _cache_lock:
+        if digest in _cache:
+            _cache.move_to_end(digest)
+            return _cache[digest]
+
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as original:
+        # Respect the camera orientation before throwing the EXIF data away
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            # JPEG has no alpha channel - flatten onto white
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+
+        prepared = {
+            "content_hash": digest,
+            "model_data": _encode(_resized(image, MODEL_MAX_SIDE), "JPEG", quality=MODEL_JPEG_QUALITY),
+            "model_mime_type": MODEL_MIME_TYPE,
+            "thumbnail_data": _encode(_resized(image, THUMBNAIL_MAX_SIDE), "WEBP", quality=THUMBNAIL_WEBP_QUALITY),
+            "thumbnail_mime_type": THUMBNAIL_MIME_TYPE
+        }
+
+    with _cache_lock:
+        _cache[digest] = prepared
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prepared
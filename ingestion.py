@@ -0,0 +1,111 @@
+"""
+Background ingestion of uploaded documents.
+
+Uploads are parsed on a worker pool as soon as they arrive, independently of
+the Streamlit script run, so a rerun doesn't lose the work and the chat stays
+responsive. Progress and the extracted text are stored in the ingestion_jobs
+table, keyed by the document's SHA-256, so re-uploading the same file (in any
+conversation) reuses the finished artifact.
+"""
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from documents import extract_document, DOCUMENT_TIME_LIMIT
+
+INGESTION_WORKERS = 2
+# Unfinished jobs not updated for this long were interrupted (e.g. a server restart) and are redone
+STALE_JOB_SECONDS = DOCUMENT_TIME_LIMIT * 2
+# Minimum seconds between progress writes to the database
+PROGRESS_WRITE_INTERVAL = 0.5
+
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+_active = {}
+_active_lock = threading.Lock()
+
+
+def document_hash(data):
+    """SHA-256 hex digest identifying a document's contents"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _is_stale(job):
+    updated_at = datetime.datetime.fromisoformat(job["updated_at"])
+    return (datetime.datetime.utcnow() - updated_at).total_seconds() > STALE_JOB_SECONDS
+
+
+def _run_job(db, doc_hash, file_name, file_type, data):
+    last_write = [0.0]
+
+    def report_progress(done, total):
+        now = time.monotonic()
+        if now - last_write[0] >= PROGRESS_WRITE_INTERVAL:
+            last_write[0] = now
+            db.update_ingestion_job(doc_hash, progress=done / total)
+
+    try:
+        db.update_ingestion_job(doc_hash, status="running", progress=0.0, error=None)
+        content = extract_document(file_name, file_type, data, progress=report_progress)
+        db.update_ingestion_job(doc_hash, status="done", progress=1.0, content=content)
+    except Exception as e:
+        logging.error(f"Ingestion of {file_name} failed: {str(e)}")
+        db.update_ingestion_job(doc_hash, status="failed", error=str(e))
+    finally:
+        with _active_lock:
+            _active.pop(doc_hash, None)
+
+
+def submit_ingestion(db, file_name, file_type, data, conversation_id=None):
+    """
+    Start parsing a document in the background, unless it's already parsed or in progress.
+
+    Args:
+        db (ChatDatabase): Database holding the job table
+        file_name (str): Name of the uploaded file
+        file_type (str): MIME type reported by the browser
+        data (bytes): The file contents
+        conversation_id (str): Conversation to attach the document to
+
+    Returns:
+        dict: The ingestion job (see IngestionJob.to_dict)
+    """
+    doc_hash = document_hash(data)
+    job = db.create_ingestion_job(doc_hash, file_name)
+    if conversation_id:
+        db.attach_document(conversation_id, doc_hash)
+
+    if job["status"] == "done":
+        return job
+
+    with _active_lock:
+        if doc_hash in _active:
+            return job
+        # A running job we don't own belongs to another server process, unless it was interrupted
+        if job["status"] == "running" and not _is_stale(job):
+            return job
+        _active[doc_hash] = _executor.submit(_run_job, db, doc_hash, file_name, file_type, data)
+
+    return db.get_ingestion_job(doc_hash)
+
+
+def wait_for_ingestion(db, doc_hash, on_progress=None, timeout=DOCUMENT_TIME_LIMIT * 2, poll_interval=0.25):
+    """
+    Block until an ingestion job finishes.
+
+    Args:
+        on_progress (callable): Called as on_progress(job) while waiting
+
+    Returns:
+        dict: The finished job, or the unfinished one if the timeout expired
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = db.get_ingestion_job(doc_hash)
+        if job is None or job["status"] in ("done", "failed") or time.monotonic() > deadline:
+            return job
+        if on_progress:
+            on_progress(job)
+        time.sleep(poll_interval)
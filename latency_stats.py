@@ -0,0 +1,39 @@
+"""Latency summaries shared by the benchmark harness and the batch runner."""
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize_latencies(latencies, errors=0, wall_time=None):
+    """Build the machine-readable summary for one measured operation"""
+    count = len(latencies) + errors
+    summary = {
+        "count": count,
+        "errors": errors,
+        "p50_ms": None,
+        "p95_ms": None,
+        "p99_ms": None,
+        "mean_ms": None,
+        "max_ms": None,
+        "throughput_rps": None
+    }
+    if latencies:
+        summary.update({
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "max_ms": round(max(latencies) * 1000, 3)
+        })
+    if wall_time:
+        summary["wall_time_s"] = round(wall_time, 4)
+        summary["throughput_rps"] = round(count / wall_time, 3)
+    return summary
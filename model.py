@@ -1,9 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, func
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, LargeBinary, func, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, relationship, defer, selectinload
 import datetime
 import os
 import base64
+import gzip
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from compression import COMPRESSION_THRESHOLD, compress_text, decompress_text, preview
+from conversation_cache import ConversationCache, freeze_messages
 
 # Create the base class for our models
 Base = declarative_base()
@@ -14,28 +23,74 @@ class Message(Base):
     
     id = Column(Integer, primary_key=True)
     role = Column(String(50), nullable=False)  # 'user' or 'assistant'
-    content = Column(Text, nullable=False)
+    # The message text, or only its first characters when the full text is in content_compressed.
+    # Use the `content` property, which always returns the full text.
+    _content = Column('content', Text, nullable=False)
+    content_compressed = Column(LargeBinary, nullable=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     conversation_id = Column(String(100), nullable=False)  # To group messages by conversation
     has_image = Column(Boolean, default=False)
+    # Exact text sent to the model for this turn, when it differs from the displayed content
+    # (e.g. with an uploaded document). Replayed in later turns to keep the prompt prefix stable.
+    _llm_content = Column('llm_content', Text, nullable=True)
+    llm_content_compressed = Column(LargeBinary, nullable=True)
+    # Which backend produced an assistant message, e.g. 'OpenAI/o3-mini'
+    provider = Column(String(200), nullable=True)
+    # Shared by the answers of one compare-mode prompt so they can be shown side by side
+    group_id = Column(String(100), nullable=True)
+    # Seconds the provider took to produce an assistant message
+    latency = Column(Float, nullable=True)
     
     # Relationship with Image model
     image = relationship("Image", uselist=False, back_populates="message", cascade="all, delete-orphan")
     
+    # Long text is compressed on assignment and only decompressed when read
+    @property
+    def content(self):
+        if self.content_compressed is not None:
+            return decompress_text(self.content_compressed)
+        return self._content
+    
+    @content.setter
+    def content(self, value):
+        self.content_compressed = compress_text(value)
+        self._content = value if self.content_compressed is None else preview(value)
+    
+    @property
+    def llm_content(self):
+        if self.llm_content_compressed is not None:
+            return decompress_text(self.llm_content_compressed)
+        return self._llm_content
+    
+    @llm_content.setter
+    def llm_content(self, value):
+        self.llm_content_compressed = compress_text(value)
+        self._llm_content = value if self.llm_content_compressed is None else None
+    
     def to_dict(self):
-        """Convert the message to a dictionary for the app"""
+        """
+        Convert the message to a dictionary for the app.
+        
+        llm_content is left out: it is only needed to build prompts, and
+        decompressing it on every display load is wasted work (see
+        ChatDatabase.get_conversation_history).
+        """
         result = {
             "id": self.id,
             "role": self.role,
             "content": self.content,
             "timestamp": self.timestamp.isoformat(),
             "conversation_id": self.conversation_id,
-            "has_image": self.has_image
+            "has_image": self.has_image,
+            "provider": self.provider,
+            "group_id": self.group_id,
+            "latency": self.latency
         }
         
-        # Include image data if present
+        # Include the image if present, as the thumbnail for display (the model copy is only
+        # sent on the turn it was uploaded). Images saved before thumbnails existed fall back to the original.
         if self.has_image and self.image:
-            result["image"] = self.image.image_data
+            result["image"] = self.image.thumbnail_data or self.image.image_data
             
         return result
 
@@ -46,10 +101,109 @@ class Image(Base):
     id = Column(Integer, primary_key=True)
     message_id = Column(Integer, ForeignKey('messages.id'), nullable=False)
     image_data = Column(Text, nullable=False)  # Base64 encoded image
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the original image
+    model_data = Column(Text, nullable=True)  # Base64 JPEG, downscaled for model input
+    thumbnail_data = Column(Text, nullable=True)  # Base64 WebP thumbnail for display
     
     # Relationship with Message model
     message = relationship("Message", back_populates="image")
 
+# Define the IngestionJob model (an uploaded document parsed in the background)
+class IngestionJob(Base):
+    __tablename__ = 'ingestion_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    document_hash = Column(String(64), nullable=False, unique=True, index=True)  # SHA-256 of the file
+    file_name = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, default='pending')  # 'pending', 'running', 'done' or 'failed'
+    progress = Column(Float, nullable=False, default=0.0)  # 0.0 - 1.0
+    content = Column(Text, nullable=True)  # Extracted text, once done
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    def to_dict(self, include_content=True):
+        """Convert the job to a dictionary for the app"""
+        result = {
+            "id": self.id,
+            "document_hash": self.document_hash,
+            "file_name": self.file_name,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat()
+        }
+        if include_content:
+            result["content"] = self.content
+        return result
+
+# Define the ConversationDocument model (links ingested documents to conversations)
+class ConversationDocument(Base):
+    __tablename__ = 'conversation_documents'
+    
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(String(100), nullable=False, index=True)
+    document_hash = Column(String(64), ForeignKey('ingestion_jobs.document_hash'), nullable=False)
+    attached_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+# Define the UsageRecord model (token usage of each provider request, for quota accounting)
+class UsageRecord(Base):
+    __tablename__ = 'usage_records'
+    
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(100), nullable=True, index=True)  # Browser session that sent the request
+    provider = Column(String(200), nullable=False)  # e.g. 'OpenAI/o3-mini'
+    key_id = Column(String(16), nullable=True, index=True)  # Hash prefix of the API key, never the key itself
+    prompt_tokens = Column(Integer, nullable=False, default=0)  # Estimated, including the history
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    latency = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+# Define the ConversationVersion model (bumped with every write to a conversation, for cache invalidation)
+class ConversationVersion(Base):
+    __tablename__ = 'conversation_versions'
+    
+    conversation_id = Column(String(100), primary_key=True)  # ALL_CONVERSATIONS for writes that touch every conversation
+    version = Column(Integer, nullable=False, default=0)
+
+# Row of conversation_versions that is added to every conversation's own version
+ALL_CONVERSATIONS = "*"
+
+def _bump_version(session, conversation_id=ALL_CONVERSATIONS):
+    """Increase a conversation's version inside the caller's transaction, so it changes exactly when the write commits"""
+    statement = sqlite_insert(ConversationVersion).values(conversation_id=conversation_id, version=1)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[ConversationVersion.conversation_id],
+        set_={"version": ConversationVersion.version + 1}
+    ))
+
+def _add_missing_columns(engine):
+    """Add columns (and their indexes) that were introduced after an existing database was created"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            # create_all skips existing tables, so indexes on new columns are created here
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+# Version of the conversation archive format written by ChatDatabase.export
+ARCHIVE_FORMAT = "offgrid-chat-archive"
+ARCHIVE_VERSION = 1
+
+def _open_archive(path, mode):
+    """Archives are gzip-compressed JSON Lines; a path without .gz is read/written uncompressed"""
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
 # Database setup function
 def init_db(db_path='chat_history.db'):
     """Initialize the database and create tables"""
@@ -63,19 +217,39 @@ def init_db(db_path='chat_history.db'):
     
     # Create all tables
     Base.metadata.create_all(engine)
+    _add_missing_columns(engine)
     
     # Create session factory
     Session = sessionmaker(bind=engine)
     
     return engine, Session
 
+# Conversations kept in memory (messages plus decoded thumbnails) so switching to them is instant
+CONVERSATION_CACHE_SIZE = int(os.environ.get("OFFGRID_CONVERSATION_CACHE_SIZE", "16"))
+
+# One cache per database file, shared by every ChatDatabase on it in this process
+_conversation_caches = {}
+_conversation_caches_lock = threading.Lock()
+
+def _conversation_cache(db_path):
+    key = os.path.abspath(db_path)
+    with _conversation_caches_lock:
+        if key not in _conversation_caches:
+            _conversation_caches[key] = ConversationCache(CONVERSATION_CACHE_SIZE)
+        return _conversation_caches[key]
+
 # Database operations
 class ChatDatabase:
     def __init__(self, db_path='chat_history.db'):
         """Initialize the database connection"""
         self.engine, self.Session = init_db(db_path)
         
-    def save_message(self, role, content, conversation_id, image_data=None):
+        self._cache = _conversation_cache(db_path)
+        self._cache_lock = threading.Lock()
+        self._prefetching = set()
+        self._prefetch_executor = None
+        
+    def save_message(self, role, content, conversation_id, image_data=None, llm_content=None, provider=None, group_id=None, latency=None):
         """Save a message to the database"""
         session = self.Session()
         try:
@@ -85,22 +259,33 @@ class ChatDatabase:
                 role=role,
                 content=content,
                 conversation_id=conversation_id,
-                has_image=has_image
+                has_image=has_image,
+                llm_content=llm_content,
+                provider=provider,
+                group_id=group_id,
+                latency=latency
             )
             
             session.add(message)
             session.flush()  # This generates an ID for the message
             
-            # Add image if present
+            # Add image if present, with its model-input and thumbnail versions
             if has_image:
+                from image_pipeline import prepare_image
+                prepared = prepare_image(base64.b64decode(image_data))
                 image = Image(
                     message_id=message.id,
-                    image_data=image_data
+                    image_data=image_data,
+                    content_hash=prepared["content_hash"],
+                    model_data=prepared["model_data"],
+                    thumbnail_data=prepared["thumbnail_data"]
                 )
                 message.image = image
                 session.add(image)
-                
+            
+            _bump_version(session, conversation_id)
             session.commit()
+            self._invalidate(conversation_id)
             return message.id
         except Exception as e:
             session.rollback()
@@ -108,33 +293,164 @@ class ChatDatabase:
         finally:
             session.close()
     
+    def _load_conversation(self, conversation_id):
+        """Read a conversation's messages, with each thumbnail also decoded to bytes (image_bytes)"""
+        session = self.Session()
+        try:
+            messages = session.query(Message).options(
+                selectinload(Message.image),
+                defer(Message._llm_content),
+                defer(Message.llm_content_compressed)
+            ).filter(
+                Message.conversation_id == conversation_id
+            ).order_by(Message.timestamp).all()
+            
+            result = [message.to_dict() for message in messages]
+            for message in result:
+                if message.get("image"):
+                    message["image_bytes"] = base64.b64decode(message["image"])
+            return freeze_messages(result)
+        finally:
+            session.close()
+    
+    def _invalidate(self, conversation_id=None):
+        """Drop a conversation (or, with None, all of them) from this process's cache after a write"""
+        self._cache.discard(conversation_id)
+    
+    def get_conversation_versions(self, conversation_ids):
+        """
+        Current versions of several conversations.
+        
+        A conversation's version increases with every write to it, from any
+        process using this database.
+        
+        Returns:
+            dict: conversation_id -> version
+        """
+        session = self.Session()
+        try:
+            rows = dict(session.query(ConversationVersion.conversation_id, ConversationVersion.version).filter(
+                ConversationVersion.conversation_id.in_(list(conversation_ids) + [ALL_CONVERSATIONS])
+            ).all())
+        finally:
+            session.close()
+        everything = rows.get(ALL_CONVERSATIONS, 0)
+        return {conversation_id: everything + rows.get(conversation_id, 0) for conversation_id in conversation_ids}
+    
+    def get_conversation_version(self, conversation_id):
+        """Current version of a conversation (see get_conversation_versions)"""
+        return self.get_conversation_versions([conversation_id])[conversation_id]
+    
     def get_conversation_messages(self, conversation_id):
-        """Get all messages for a specific conversation"""
+        """
+        Get all messages for a specific conversation.
+        
+        Returns:
+            tuple: Read-only message mappings (see Message.to_dict). They are
+                shared with other callers; copy one with dict() to change it.
+        """
+        if not self._cache.size:
+            return self._load_conversation(conversation_id)
+        
+        # Read before loading, so a write during the load only makes the cached copy look stale
+        version = self.get_conversation_version(conversation_id)
+        messages = self._cache.get(conversation_id, version)
+        if messages is None:
+            messages = self._load_conversation(conversation_id)
+            self._cache.store(conversation_id, version, messages)
+        return messages
+    
+    def get_conversation_history(self, conversation_id):
+        """
+        Get a conversation's messages as the model saw them, for building prompts.
+        
+        Only the columns a prompt needs are read, and each message's text is
+        decompressed once: llm_content when the turn had one, else content.
+        Not cached - it is read once per turn.
+        
+        Returns:
+            list: [{"role": ..., "content": ..., "group_id": ...}, ...] in order
+        """
         session = self.Session()
         try:
-            messages = session.query(Message).filter(
+            rows = session.query(
+                Message.role,
+                Message._content,
+                Message.content_compressed,
+                Message._llm_content,
+                Message.llm_content_compressed,
+                Message.group_id
+            ).filter(
                 Message.conversation_id == conversation_id
             ).order_by(Message.timestamp).all()
             
-            return [message.to_dict() for message in messages]
+            history = []
+            for role, content, content_compressed, llm_content, llm_content_compressed, group_id in rows:
+                if llm_content_compressed is not None:
+                    content = decompress_text(llm_content_compressed)
+                elif llm_content:
+                    content = llm_content
+                elif content_compressed is not None:
+                    content = decompress_text(content_compressed)
+                history.append({"role": role, "content": content, "group_id": group_id})
+            return history
         finally:
             session.close()
     
+    def _prefetch(self, conversation_id, version):
+        try:
+            self._cache.store(conversation_id, version, self._load_conversation(conversation_id))
+        except Exception as e:
+            print(f"Error prefetching conversation {conversation_id}: {str(e)}")
+        finally:
+            with self._cache_lock:
+                self._prefetching.discard(conversation_id)
+    
+    def prefetch_conversations(self, conversation_ids):
+        """
+        Load conversations into the cache in the background.
+        
+        Conversations already cached or being loaded are skipped. Returns
+        immediately; a later get_conversation_messages() for a prefetched
+        conversation is served from memory.
+        """
+        conversation_ids = list(conversation_ids)[:self._cache.size]
+        if not conversation_ids:
+            return
+        versions = self.get_conversation_versions(conversation_ids)
+        with self._cache_lock:
+            if self._prefetch_executor is None:
+                self._prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-prefetch")
+            for conversation_id in conversation_ids:
+                version = versions[conversation_id]
+                if self._cache.get(conversation_id, version) is not None or conversation_id in self._prefetching:
+                    continue
+                self._prefetching.add(conversation_id)
+                self._prefetch_executor.submit(self._prefetch, conversation_id, version)
+    
     def get_all_conversations(self):
         """Get a list of all conversation IDs"""
         session = self.Session()
         try:
-            # Get distinct conversation IDs and their most recent timestamp
+            # Get distinct conversation IDs, their most recent timestamp and their first message
             conversations = session.query(
                 Message.conversation_id,
                 # Get the max timestamp for each conversation
-                func.max(Message.timestamp).label('last_updated')
+                func.max(Message.timestamp).label('last_updated'),
+                func.min(Message.id).label('first_message_id')
             ).group_by(Message.conversation_id).all()
             
+            # The stored text column holds the whole message or, for compressed ones, its preview -
+            # enough for a title without loading any conversation
+            first_messages = dict(session.query(Message.id, Message._content).filter(
+                Message.id.in_([conv[2] for conv in conversations])
+            ).all()) if conversations else {}
+            
             return [
                 {
                     'conversation_id': conv[0], 
-                    'last_updated': conv[1].isoformat()
+                    'last_updated': conv[1].isoformat(),
+                    'first_message': first_messages.get(conv[2], '')
                 } 
                 for conv in conversations
             ]
@@ -153,8 +469,15 @@ class ChatDatabase:
             # Delete each message (and associated images due to cascade)
             for message in messages:
                 session.delete(message)
-                
+            
+            # Detach its documents; the ingested text stays cached for re-uploads
+            session.query(ConversationDocument).filter(
+                ConversationDocument.conversation_id == conversation_id
+            ).delete()
+            
+            _bump_version(session, conversation_id)
             session.commit()
+            self._invalidate(conversation_id)
             return True
         except Exception as e:
             session.rollback()
@@ -162,6 +485,350 @@ class ChatDatabase:
         finally:
             session.close()
     
+    def create_ingestion_job(self, document_hash, file_name):
+        """Create an ingestion job for a document, or return the existing one"""
+        session = self.Session()
+        try:
+            job = session.query(IngestionJob).filter(
+                IngestionJob.document_hash == document_hash
+            ).first()
+            if job is None:
+                job = IngestionJob(document_hash=document_hash, file_name=file_name)
+                session.add(job)
+                session.commit()
+            return job.to_dict()
+        except Exception as e:
+            session.rollback()
+            # Another session may have created it at the same moment
+            existing = self.get_ingestion_job(document_hash)
+            if existing:
+                return existing
+            raise e
+        finally:
+            session.close()
+    
+    def get_ingestion_job(self, document_hash):
+        """Get an ingestion job by document hash, or None"""
+        session = self.Session()
+        try:
+            job = session.query(IngestionJob).filter(
+                IngestionJob.document_hash == document_hash
+            ).first()
+            return job.to_dict() if job else None
+        finally:
+            session.close()
+    
+    def update_ingestion_job(self, document_hash, **fields):
+        """Update the status, progress, content or error of an ingestion job"""
+        session = self.Session()
+        try:
+            fields["updated_at"] = datetime.datetime.utcnow()
+            session.query(IngestionJob).filter(
+                IngestionJob.document_hash == document_hash
+            ).update(fields)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def attach_document(self, conversation_id, document_hash):
+        """Link an ingested document to a conversation (idempotent)"""
+        session = self.Session()
+        try:
+            exists = session.query(ConversationDocument).filter(
+                ConversationDocument.conversation_id == conversation_id,
+                ConversationDocument.document_hash == document_hash
+            ).first()
+            if exists is None:
+                session.add(ConversationDocument(conversation_id=conversation_id, document_hash=document_hash))
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_conversation_documents(self, conversation_id):
+        """Get the ingestion jobs of the documents attached to a conversation (without their content)"""
+        session = self.Session()
+        try:
+            jobs = session.query(IngestionJob).options(defer(IngestionJob.content)).join(
+                ConversationDocument, ConversationDocument.document_hash == IngestionJob.document_hash
+            ).filter(
+                ConversationDocument.conversation_id == conversation_id
+            ).order_by(ConversationDocument.attached_at).all()
+            
+            return [job.to_dict(include_content=False) for job in jobs]
+        finally:
+            session.close()
+    
+    def record_usage(self, session_id, provider, prompt_tokens, completion_tokens, key_id=None, latency=None):
+        """Store the token usage of one provider request"""
+        session = self.Session()
+        try:
+            session.add(UsageRecord(
+                session_id=session_id,
+                provider=provider,
+                key_id=key_id,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                latency=latency
+            ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_usage_summary(self, session_id=None, key_id=None, since=None):
+        """
+        Total requests and tokens per provider.
+        
+        Args:
+            session_id (str): Only count requests from this session
+            key_id (str): Only count requests made with this API key
+            since (datetime): Only count requests made after this (UTC) time
+            
+        Returns:
+            list: One dict per provider with provider, requests, prompt_tokens and completion_tokens
+        """
+        session = self.Session()
+        try:
+            query = session.query(
+                UsageRecord.provider,
+                func.count(UsageRecord.id),
+                func.sum(UsageRecord.prompt_tokens),
+                func.sum(UsageRecord.completion_tokens)
+            )
+            if session_id is not None:
+                query = query.filter(UsageRecord.session_id == session_id)
+            if key_id is not None:
+                query = query.filter(UsageRecord.key_id == key_id)
+            if since is not None:
+                query = query.filter(UsageRecord.created_at >= since)
+            
+            return [
+                {
+                    'provider': row[0],
+                    'requests': row[1],
+                    'prompt_tokens': row[2] or 0,
+                    'completion_tokens': row[3] or 0
+                }
+                for row in query.group_by(UsageRecord.provider).order_by(UsageRecord.provider).all()
+            ]
+        finally:
+            session.close()
+    
+    def compress_messages(self, batch_size=500):
+        """
+        Compress long messages stored before compression was enabled.
+        
+        Returns:
+            int: Number of messages rewritten
+        """
+        session = self.Session()
+        rewritten = 0
+        try:
+            query = session.query(Message).filter(
+                ((Message.content_compressed.is_(None)) & (func.length(Message._content) >= COMPRESSION_THRESHOLD)) |
+                ((Message.llm_content_compressed.is_(None)) & (func.length(Message._llm_content) >= COMPRESSION_THRESHOLD))
+            ).order_by(Message.id)
+            
+            last_id = 0
+            while True:
+                batch = query.filter(Message.id > last_id).limit(batch_size).all()
+                if not batch:
+                    break
+                for message in batch:
+                    # Re-assigning runs the text through the compressing setters
+                    message.content = message.content
+                    message.llm_content = message.llm_content
+                    last_id = message.id
+                rewritten += len(batch)
+                session.commit()
+            return rewritten
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def export(self, conversation_ids, path, batch_size=500):
+        """
+        Stream conversations to a compressed JSON Lines archive.
+        
+        Messages are read in batches, so memory use doesn't grow with the
+        history size. Each distinct image is written once, before the first
+        message that uses it, and later messages refer to it by hash.
+        
+        Args:
+            conversation_ids (list): Conversations to export, or None for all
+            path (str): Archive path; '.jsonl.gz' is compressed
+            batch_size (int): Messages loaded per database round trip
+        
+        Returns:
+            dict: Number of messages and distinct images written
+        """
+        session = self.Session()
+        written_images = set()
+        counts = {"messages": 0, "images": 0}
+        try:
+            query = session.query(Message).options(selectinload(Message.image))
+            if conversation_ids is not None:
+                query = query.filter(Message.conversation_id.in_(list(conversation_ids)))
+            query = query.order_by(Message.conversation_id, Message.timestamp, Message.id)
+            
+            with _open_archive(path, "w") as archive:
+                header = {
+                    "type": "header",
+                    "format": ARCHIVE_FORMAT,
+                    "version": ARCHIVE_VERSION,
+                    "exported_at": datetime.datetime.utcnow().isoformat()
+                }
+                archive.write(json.dumps(header) + "\n")
+                
+                for message in query.yield_per(batch_size):
+                    image_hash = None
+                    if message.has_image and message.image:
+                        image = message.image
+                        image_hash = image.content_hash or hashlib.sha256(base64.b64decode(image.image_data)).hexdigest()
+                        if image_hash not in written_images:
+                            archive.write(json.dumps({
+                                "type": "image",
+                                "content_hash": image_hash,
+                                "image_data": image.image_data,
+                                "model_data": image.model_data,
+                                "thumbnail_data": image.thumbnail_data
+                            }) + "\n")
+                            written_images.add(image_hash)
+                            counts["images"] += 1
+                    
+                    archive.write(json.dumps({
+                        "type": "message",
+                        "conversation_id": message.conversation_id,
+                        "role": message.role,
+                        "content": message.content,
+                        "timestamp": message.timestamp.isoformat(),
+                        "llm_content": message.llm_content,
+                        "provider": message.provider,
+                        "group_id": message.group_id,
+                        "latency": message.latency,
+                        "image_hash": image_hash
+                    }) + "\n")
+                    counts["messages"] += 1
+            return counts
+        finally:
+            session.close()
+    
+    def import_(self, path, batch_size=500):
+        """
+        Load an archive written by export().
+        
+        Inserts are committed in batches of `batch_size` messages. Messages
+        that already exist (same conversation, role and timestamp) are skipped,
+        so an interrupted import can simply be run again to resume it.
+        
+        Returns:
+            dict: Number of messages imported and skipped
+        """
+        session = self.Session()
+        counts = {"imported": 0, "skipped": 0}
+        # Images read but not yet attached to an imported message. A record is kept
+        # until a message uses it: the copy already in the database may predate
+        # content_hash, so it can't be looked up by hash.
+        pending_images = {}
+        current_conversation = None
+        existing_keys = set()
+        in_batch = 0
+        try:
+            with _open_archive(path, "r") as archive:
+                for line_number, line in enumerate(archive, start=1):
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    record_type = record.get("type")
+                    
+                    if record_type == "header":
+                        if record.get("format") != ARCHIVE_FORMAT or record.get("version", 0) > ARCHIVE_VERSION:
+                            raise ValueError(f"Unsupported archive: {record.get('format')} version {record.get('version')}")
+                        continue
+                    if record_type == "image":
+                        pending_images[record["content_hash"]] = record
+                        continue
+                    if record_type != "message":
+                        raise ValueError(f"Unknown record type {record_type!r} on line {line_number}")
+                    
+                    # Archives are ordered by conversation; load each one's existing keys once
+                    if record["conversation_id"] != current_conversation:
+                        current_conversation = record["conversation_id"]
+                        existing_keys = {
+                            (role, timestamp.isoformat())
+                            for role, timestamp in session.query(Message.role, Message.timestamp).filter(
+                                Message.conversation_id == current_conversation
+                            )
+                        }
+                    
+                    key = (record["role"], record["timestamp"])
+                    if key in existing_keys:
+                        counts["skipped"] += 1
+                        continue
+                    existing_keys.add(key)
+                    
+                    message = Message(
+                        role=record["role"],
+                        content=record["content"],
+                        timestamp=datetime.datetime.fromisoformat(record["timestamp"]),
+                        conversation_id=record["conversation_id"],
+                        has_image=record.get("image_hash") is not None,
+                        llm_content=record.get("llm_content"),
+                        provider=record.get("provider"),
+                        group_id=record.get("group_id"),
+                        latency=record.get("latency")
+                    )
+                    
+                    image_hash = record.get("image_hash")
+                    if image_hash:
+                        image_record = pending_images.pop(image_hash, None)
+                        if image_record is None:
+                            # Already imported for an earlier message (this run or an interrupted
+                            # one, both set content_hash) - copy it from the database
+                            stored = session.query(Image).filter(Image.content_hash == image_hash).first()
+                            if stored is None:
+                                raise ValueError(f"Image {image_hash} missing from archive (line {line_number})")
+                            image_record = {
+                                "image_data": stored.image_data,
+                                "model_data": stored.model_data,
+                                "thumbnail_data": stored.thumbnail_data
+                            }
+                        message.image = Image(
+                            image_data=image_record["image_data"],
+                            content_hash=image_hash,
+                            model_data=image_record.get("model_data"),
+                            thumbnail_data=image_record.get("thumbnail_data")
+                        )
+                    
+                    session.add(message)
+                    counts["imported"] += 1
+                    in_batch += 1
+                    if in_batch >= batch_size:
+                        _bump_version(session)
+                        session.commit()
+                        self._invalidate()
+                        in_batch = 0
+            
+            _bump_version(session)
+            session.commit()
+            self._invalidate()
+            return counts
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
     def generate_conversation_id(self):
         """Generate a unique conversation ID"""
         import uuid
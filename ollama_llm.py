@@ -1,18 +1,164 @@
 import requests
 import json, re
-import streamlit as st
 import logging
+import os
 import time
+import threading
+from ollama_scheduler import scheduler
 
-OLLAMA_ENDPOINT = "http://localhost:11434/api/chat"
+OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_ENDPOINT = f"{OLLAMA_HOST}/api/chat"
+OLLAMA_GENERATE_ENDPOINT = f"{OLLAMA_HOST}/api/generate"
+OLLAMA_TAGS_ENDPOINT = f"{OLLAMA_HOST}/api/tags"
+OLLAMA_PS_ENDPOINT = f"{OLLAMA_HOST}/api/ps"
 
-def ollama_chat_request(prompt, conversation=None, model=None):
+# Model used when the caller doesn't name one
+DEFAULT_OLLAMA_MODEL = os.environ.get("OFFGRID_OLLAMA_MODEL", "deepseek-r1")
+# Model for drafts shown while an online answer is on its way: small, and not a reasoning
+# model, whose first tokens would be chain-of-thought rather than the answer
+DRAFT_OLLAMA_MODEL = os.environ.get("OFFGRID_DRAFT_MODEL", "llama3.2")
+
+# How long Ollama keeps a model in memory after the last request
+OLLAMA_KEEP_ALIVE = "30m"
+# Context window (tokens) used for every request. Changing it between requests forces a
+# model reload and throws away the prompt cache, so it is set once per process. When a
+# prompt doesn't fit, Ollama drops tokens from the front of the conversation: the
+# prefix then differs from the previous request and the whole prompt is evaluated again.
+# The default leaves room for a document turn (MAX_DOCUMENT_CHARS, ~2.5k tokens) plus
+# history; larger windows need more memory per loaded model.
+OLLAMA_NUM_CTX = int(os.environ.get("OFFGRID_OLLAMA_NUM_CTX", "8192"))
+# How long the installed/loaded model lists are cached (seconds)
+MODEL_LIST_TTL = 10
+
+
+class OllamaError(Exception):
+    """A chat request that Ollama didn't answer"""
+
+
+_model_list_cache = {}
+_model_list_lock = threading.Lock()
+_preloading = set()
+
+
+def _normalize_model_name(model):
+    """Ollama treats 'llama3' and 'llama3:latest' as the same model"""
+    model = (model or "").strip()
+    return model if ":" in model else f"{model}:latest"
+
+
+def _fetch_model_names(endpoint, ttl=MODEL_LIST_TTL):
+    """Return the model names listed by /api/tags or /api/ps, cached for `ttl` seconds"""
+    now = time.monotonic()
+    with _model_list_lock:
+        cached = _model_list_cache.get(endpoint)
+    if cached and now - cached[0] < ttl:
+        # Failures are cached too, so a down server isn't probed on every rerun
+        if isinstance(cached[1], Exception):
+            raise cached[1]
+        return cached[1]
+
+    try:
+        response = requests.get(endpoint, timeout=2)
+        response.raise_for_status()
+        names = set()
+        for entry in response.json().get("models", []):
+            name = entry.get("name") or entry.get("model")
+            if name:
+                names.add(_normalize_model_name(name))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        with _model_list_lock:
+            _model_list_cache[endpoint] = (time.monotonic(), e)
+        raise
+
+    with _model_list_lock:
+        _model_list_cache[endpoint] = (time.monotonic(), names)
+    return names
+
+
+def list_local_models():
+    """Names of the models installed on the Ollama server (/api/tags)"""
+    return _fetch_model_names(OLLAMA_TAGS_ENDPOINT)
+
+
+def list_loaded_models():
+    """Names of the models currently loaded in memory (/api/ps)"""
+    return _fetch_model_names(OLLAMA_PS_ENDPOINT)
+
+
+def is_model_available(model):
+    """
+    Check whether a model is installed on the Ollama server.
+    
+    Returns:
+        bool or None: True/False, or None if the server could not be asked
+    """
+    try:
+        return _normalize_model_name(model) in list_local_models()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Could not list Ollama models: {str(e)}")
+        return None
+
+
+def preload_ollama_model(model, keep_alive=OLLAMA_KEEP_ALIVE, background=True, session_id=None):
+    """
+    Load a model into memory ahead of the first chat request.
+    
+    Sends an empty generate request, which makes Ollama load the model and keep
+    it resident for `keep_alive`. Runs in a daemon thread unless background=False.
+    The request queues in the shared scheduler like a chat request for `model`,
+    so it never loads a second model while other sessions' requests are waiting.
+    
+    Returns:
+        bool: True if a preload was started (or completed, when not in background)
+    """
+    normalized = _normalize_model_name(model)
+    try:
+        if normalized in list_loaded_models():
+            return False
+    except (requests.exceptions.RequestException, ValueError):
+        # Can't tell what's loaded; the preload below will report the real problem
+        pass
+
+    with _model_list_lock:
+        if normalized in _preloading:
+            return False
+        _preloading.add(normalized)
+
+    def _preload():
+        try:
+            with scheduler.slot(model, session_id=session_id):
+                requests.post(
+                    OLLAMA_GENERATE_ENDPOINT,
+                    json={"model": model, "keep_alive": keep_alive, "options": {"num_ctx": OLLAMA_NUM_CTX}},
+                    timeout=300
+                )
+            print(f"Preloaded Ollama model: {model}")
+        except Exception as e:
+            print(f"Error preloading Ollama model {model}: {e}")
+        finally:
+            with _model_list_lock:
+                _preloading.discard(normalized)
+                # The loaded model list has changed
+                _model_list_cache.pop(OLLAMA_PS_ENDPOINT, None)
+
+    if background:
+        threading.Thread(target=_preload, daemon=True).start()
+    else:
+        _preload()
+    return True
+
+
+def ollama_chat_request(prompt, conversation=None, model=None, images=None):
     """
     Sends a prompt to the Ollama API and returns the response content.
+    Images (base64 JPEG) are attached to the prompt for vision models such as llava.
+    
+    Raises:
+        OllamaError: When the server can't be reached, answers with an error or
+            returns something that isn't a chat response
     """
-    # Use the model selected in the sidebar if available, otherwise use the default
     if model is None:
-        model = st.session_state.get('model_option', 'deepseek-r1')
+        model = DEFAULT_OLLAMA_MODEL
     
     if conversation is None:
         conversation = []
@@ -20,51 +166,69 @@ def ollama_chat_request(prompt, conversation=None, model=None):
     # Create a full conversation history to send to Ollama
     messages = conversation.copy()
     # Add the current prompt as the last user message
-    messages.append({"role": "user", "content": prompt})
+    user_message = {"role": "user", "content": prompt}
+    if images:
+        user_message["images"] = list(images)
+    messages.append(user_message)
     
-    # Debug the conversation being sent
-    print(f"Sending conversation to Ollama: {json.dumps(messages, indent=2)}")
+    # Debug the conversation being sent (without the image payloads)
+    print(f"Sending conversation to Ollama: {json.dumps(messages[:-1] + [{'role': 'user', 'content': prompt}], indent=2)}")
     
     data = {
         "model": model,
         "messages": messages,
-        "stream": False
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_ctx": OLLAMA_NUM_CTX}
     }
 
     try:
         response = requests.post(OLLAMA_ENDPOINT, json=data)
+    except requests.exceptions.ConnectionError as e:
+        print("Error: Could not connect to the Ollama server.")
+        raise OllamaError("Failed to connect to the Ollama server. Please make sure it's running at " + OLLAMA_ENDPOINT) from e
+    except requests.exceptions.RequestException as e:
+        print(f"Error making the request: {e}")
+        raise OllamaError(f"Error when making request to the AI model: {str(e)}") from e
+
+    try:
         response_json = response.json()
         # Debug the response received
         print(f"Response from Ollama: {json.dumps(response_json, indent=2)}")
-    except json.JSONDecodeError:
+    except ValueError as e:
         print("Error: Received an invalid JSON response.")
-        return "I received an invalid response from the AI model. Please try again."
-    except requests.exceptions.ConnectionError:
-        print("Error: Could not connect to the Ollama server.")
-        return "Failed to connect to the Ollama server. Please make sure it's running at " + OLLAMA_ENDPOINT
-    except Exception as e:
-        print(f"Error making the request: {e}")
-        return f"Error when making request to the AI model: {str(e)}"
+        raise OllamaError(f"Ollama returned an invalid response (HTTP {response.status_code})") from e
+
+    error = response_json.get("error") if isinstance(response_json, dict) else None
+    if not response.ok or error:
+        raise OllamaError(f"Ollama returned HTTP {response.status_code}: {error or response.reason}")
 
     try:
-        content = response_json["message"]["content"].strip()
-        return content
-    except KeyError:
+        return response_json["message"]["content"].strip()
+    except (KeyError, TypeError, AttributeError):
         print("Error: 'message' key not found in the response:")
         print(response_json)
-        return "The AI model returned an unexpected response. Please try again."
+        raise OllamaError("The AI model returned an unexpected response")
 
 
-def call_ollama_llm(prompt, max_retries=3, retry_delay=2, conversation_history=None):
+def call_ollama_llm(prompt, max_retries=3, retry_delay=2, conversation_history=None, session_id=None, on_wait=None, model=None, images=None, on_attempt=None):
     """
     Generates a response based on the provided prompt and conversation history.
     Function signature matches call_openai_llm (except for api_key) for compatibility.
     
+    Requests go through the shared OllamaScheduler, so concurrent sessions
+    queue fairly instead of running competing generations on the Ollama host.
+    
     Args:
         prompt (str): The current prompt to send to the LLM
         max_retries (int): Maximum number of retries on failure
         retry_delay (int): Delay between retries in seconds
         conversation_history (list): List of previous messages in the conversation
+        session_id (str): Identifies the caller for fair queueing across sessions
+        on_wait (callable): Called as on_wait(position, estimated_wait) while queued
+        model (str): Ollama model to use; defaults to DEFAULT_OLLAMA_MODEL
+        images (list): Base64 JPEG images to attach to the current prompt
+        on_attempt (callable): Called before every attempt, including retries; an exception from it is not retried
         
     Returns:
         str: The LLM-generated response as a string
@@ -72,18 +236,26 @@ def call_ollama_llm(prompt, max_retries=3, retry_delay=2, conversation_history=N
     if prompt == "" or prompt is None:
         prompt = "Hello"
 
-    # Get the selected model from session state if available
-    model = st.session_state.get('model_option', 'deepseek-r1')
+    if model is None:
+        model = DEFAULT_OLLAMA_MODEL
+    
+    # Fail fast on unknown models instead of burning through the retries
+    if is_model_available(model) is False:
+        raise ValueError(f"Model '{model}' is not installed on the Ollama server. Run 'ollama pull {model}' to download it.")
     
     # Set up retry mechanism
     retries = 0
     while retries <= max_retries:
+        # Outside the try: a rate limit from the caller must not be retried
+        if on_attempt:
+            on_attempt()
         try:
-            response = ollama_chat_request(prompt, conversation_history, model)
+            with scheduler.slot(model, session_id=session_id, on_wait=on_wait):
+                response = ollama_chat_request(prompt, conversation_history, model, images)
             
-            # If the response is None or empty, provide a fallback response
+            # An empty answer is a failed request, never something to show or save
             if response is None or response.strip() == "":
-                return "I apologize, but I couldn't generate a proper response. Please try again."
+                raise OllamaError("The AI model returned an empty response")
                 
             return response.strip()
             
@@ -102,5 +274,55 @@ def call_ollama_llm(prompt, max_retries=3, retry_delay=2, conversation_history=N
     return "I'm sorry, I couldn't process your request at this time."
 
 
+def stream_ollama_llm(prompt, conversation_history=None, session_id=None, on_wait=None, model=None, images=None):
+    """
+    Like call_ollama_llm, but yields the answer in chunks as Ollama generates it.
+    
+    The scheduler slot is held until the stream ends (or the generator is
+    closed). There are no retries: part of the answer may already have been
+    delivered when an error happens.
+    
+    Yields:
+        str: Pieces of the answer, in order
+    """
+    if prompt == "" or prompt is None:
+        prompt = "Hello"
+    if model is None:
+        model = DEFAULT_OLLAMA_MODEL
+    
+    if is_model_available(model) is False:
+        raise ValueError(f"Model '{model}' is not installed on the Ollama server. Run 'ollama pull {model}' to download it.")
+    
+    messages = list(conversation_history or [])
+    user_message = {"role": "user", "content": prompt}
+    if images:
+        user_message["images"] = list(images)
+    messages.append(user_message)
+    
+    data = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_ctx": OLLAMA_NUM_CTX}
+    }
+    
+    with scheduler.slot(model, session_id=session_id, on_wait=on_wait):
+        with requests.post(OLLAMA_ENDPOINT, json=data, stream=True) as response:
+            response.raise_for_status()
+            # One JSON object per line, the last one with done=true
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Ollama error: {chunk['error']}")
+                content = chunk.get("message", {}).get("content")
+                if content:
+                    yield content
+                if chunk.get("done"):
+                    break
+
+
 if __name__ == "__main__":
     print(call_ollama_llm("Hello"))
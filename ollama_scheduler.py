@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Defaults suit a single GPU-less box: one generation at a time
+DEFAULT_MAX_CONCURRENT = int(os.environ.get("OFFGRID_OLLAMA_MAX_CONCURRENT", "1"))
+DEFAULT_MAX_PER_MODEL = int(os.environ.get("OFFGRID_OLLAMA_MAX_PER_MODEL", "1"))
+# How many requests for the already-loaded model may jump ahead before other models get a turn
+DEFAULT_MODEL_BATCH = int(os.environ.get("OFFGRID_OLLAMA_MODEL_BATCH", "4"))
+# Service time assumed for a model before we have measured it (seconds)
+DEFAULT_SERVICE_TIME = 20.0
+
+
+class _Ticket:
+    """A single queued request for an Ollama generation slot"""
+
+    def __init__(self, model, session_id):
+        self.model = model
+        self.session_id = session_id
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class OllamaScheduler:
+    """
+    In-process scheduler in front of the Ollama backend.
+
+    Requests are queued per session and served round-robin across sessions so
+    one busy tab can't starve the others. Concurrency is bounded globally and
+    per model, and requests for the model Ollama already has loaded are
+    preferred (up to `max_model_batch` in a row) to avoid reload churn.
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, max_per_model=DEFAULT_MAX_PER_MODEL,
+                 max_model_batch=DEFAULT_MODEL_BATCH):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_model = max(1, max_per_model)
+        self.max_model_batch = max(1, max_model_batch)
+
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # session_id -> deque of tickets, in round-robin order
+        self._running = {}            # model -> number of generations in flight
+        self._active = 0
+        self._loaded_model = None
+        self._batch_count = 0
+        self._service_times = {}      # model -> moving average of generation time
+
+    @contextmanager
+    def slot(self, model, session_id=None, on_wait=None, poll_interval=1.0):
+        """
+        Block until a generation slot for `model` is available.
+
+        Args:
+            model (str): The Ollama model the request will use
+            session_id (str): Identifies the caller for fair ordering
+            on_wait (callable): Called as on_wait(position, estimated_wait) while queued
+            poll_interval (float): Seconds between on_wait updates
+        """
+        ticket = _Ticket(model, session_id or "anonymous")
+        with self._cond:
+            self._queues.setdefault(ticket.session_id, deque()).append(ticket)
+            self._dispatch()
+
+        try:
+            while True:
+                with self._cond:
+                    if ticket.granted:
+                        break
+                    position, estimated_wait = self._status(ticket)
+                if on_wait:
+                    on_wait(position, estimated_wait)
+                with self._cond:
+                    if not ticket.granted:
+                        self._cond.wait(poll_interval)
+        except BaseException:
+            with self._cond:
+                if ticket.granted:
+                    self._release(ticket, None)
+                else:
+                    self._remove(ticket)
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._release(ticket, time.monotonic() - started)
+
+    def status(self):
+        """Snapshot of the scheduler state (for display and benchmarks)"""
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "loaded_model": self._loaded_model,
+                "running": dict(self._running)
+            }
+
+    def estimated_service_time(self, model):
+        return self._service_times.get(model, DEFAULT_SERVICE_TIME)
+
+    # Internal helpers - callers must hold self._cond
+
+    def _select(self, queues, loaded_model, batch_count, running):
+        """Pick the next ticket from the heads of the session queues"""
+        candidates = [
+            q[0] for q in queues.values()
+            if q and running.get(q[0].model, 0) < self.max_per_model
+        ]
+        if not candidates:
+            return None
+        if loaded_model is not None and batch_count < self.max_model_batch:
+            for ticket in candidates:
+                if ticket.model == loaded_model:
+                    return ticket
+        return candidates[0]
+
+    def _dispatch(self):
+        granted = False
+        while self._active < self.max_concurrent:
+            ticket = self._select(self._queues, self._loaded_model, self._batch_count, self._running)
+            if ticket is None:
+                break
+            self._remove(ticket)
+            # Move the session to the back of the round-robin order
+            if ticket.session_id in self._queues:
+                self._queues.move_to_end(ticket.session_id)
+            self._grant(ticket)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        self._active += 1
+        self._running[ticket.model] = self._running.get(ticket.model, 0) + 1
+        if ticket.model == self._loaded_model:
+            self._batch_count += 1
+        else:
+            self._loaded_model = ticket.model
+            self._batch_count = 1
+
+    def _release(self, ticket, elapsed):
+        self._active -= 1
+        self._running[ticket.model] -= 1
+        if not self._running[ticket.model]:
+            del self._running[ticket.model]
+        if elapsed is not None:
+            previous = self._service_times.get(ticket.model)
+            self._service_times[ticket.model] = elapsed if previous is None else 0.7 * previous + 0.3 * elapsed
+        self._dispatch()
+
+    def _remove(self, ticket):
+        queue = self._queues.get(ticket.session_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[ticket.session_id]
+
+    def _status(self, ticket):
+        """Simulate the dispatch order to find the ticket's position and expected wait"""
+        queues = OrderedDict((sid, deque(q)) for sid, q in self._queues.items())
+        loaded_model = self._loaded_model
+        batch_count = self._batch_count
+        ahead = []
+
+        while True:
+            # Assume requests run one after another when projecting the order
+            nxt = self._select(queues, loaded_model, batch_count, {})
+            if nxt is None or nxt is ticket:
+                break
+            ahead.append(nxt)
+            queues[nxt.session_id].popleft()
+            if not queues[nxt.session_id]:
+                del queues[nxt.session_id]
+            else:
+                queues.move_to_end(nxt.session_id)
+            if nxt.model == loaded_model:
+                batch_count += 1
+            else:
+                loaded_model = nxt.model
+                batch_count = 1
+
+        # Work in flight plus everything ahead of us, spread over the available slots
+        pending = sum(self.estimated_service_time(t.model) for t in ahead)
+        pending += sum(self.estimated_service_time(m) * n for m, n in self._running.items())
+        estimated_wait = pending / self.max_concurrent
+        return len(ahead), estimated_wait
+
+
+# Shared by every Streamlit session in this process
+scheduler = OllamaScheduler()
@@ -2,7 +2,41 @@ from openai import OpenAI
 import logging
 import time
 
-def call_openai_llm(prompt, api_key, max_retries=3, retry_delay=2, conversation_history=None):
+# o3-mini has no image input, so turns with images go to a vision-capable model
+OPENAI_MODEL = "o3-mini"
+OPENAI_VISION_MODEL = "gpt-4o-mini"
+
+def _build_request(prompt, conversation_history=None, images=None):
+    """Messages, model and extra options for a chat completion request"""
+    # Prepare messages array for the API call
+    messages = []
+    
+    # Add conversation history if provided
+    if conversation_history and isinstance(conversation_history, list):
+        messages.extend(conversation_history)
+    
+    # Add the current user prompt, with any images as data URL content parts
+    if images:
+        content = [{"type": "text", "text": prompt}]
+        for image in images:
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{image}"}
+            })
+        model = OPENAI_VISION_MODEL
+    else:
+        content = prompt
+        model = OPENAI_MODEL
+    messages.append({
+        "role": "user",
+        "content": content
+    })
+    
+    # reasoning_effort is only accepted by the o-series reasoning models
+    options = {"reasoning_effort": "medium"} if model.startswith("o") else {}
+    return messages, model, options
+
+def call_openai_llm(prompt, api_key, max_retries=3, retry_delay=2, conversation_history=None, images=None, on_attempt=None):
     """
     Call the OpenAI LLM API with proper error handling and retries.
     
@@ -12,6 +46,8 @@ def call_openai_llm(prompt, api_key, max_retries=3, retry_delay=2, conversation_
         max_retries (int): Maximum number of retries on failure
         retry_delay (int): Delay between retries in seconds
         conversation_history (list): List of previous messages in the conversation
+        images (list): Base64 JPEG images to attach to the current prompt
+        on_attempt (callable): Called before every attempt, including retries; an exception from it is not retried
         
     Returns:
         str: The LLM response text
@@ -21,29 +57,20 @@ def call_openai_llm(prompt, api_key, max_retries=3, retry_delay=2, conversation_
     
     # Initialize OpenAI client
     client = OpenAI(api_key=api_key)
-    
-    # Prepare messages array for the API call
-    messages = []
-    
-    # Add conversation history if provided
-    if conversation_history and isinstance(conversation_history, list):
-        messages.extend(conversation_history)
-    
-    # Add the current user prompt
-    messages.append({
-        "role": "user",
-        "content": prompt
-    })
+    messages, model, options = _build_request(prompt, conversation_history, images)
     
     # Set up retry mechanism
     retries = 0
     while retries <= max_retries:
+        # Outside the try: a rate limit from the caller must not be retried
+        if on_attempt:
+            on_attempt()
         try:
             # Call the API with the full conversation history
             response = client.chat.completions.create(
-                model="o3-mini",
+                model=model,
                 messages=messages,
-                reasoning_effort="medium"
+                **options
             )
             
             # Return the response content
@@ -62,3 +89,28 @@ def call_openai_llm(prompt, api_key, max_retries=3, retry_delay=2, conversation_
     
     # This should never be reached due to the exception in the loop
     return "I'm sorry, I couldn't process your request at this time."
+
+
+def stream_openai_llm(prompt, api_key, conversation_history=None, images=None):
+    """
+    Like call_openai_llm, but yields the answer in chunks as it is generated.
+    There are no retries once the stream has started.
+    
+    Yields:
+        str: Pieces of the answer, in order
+    """
+    if not api_key:
+        raise ValueError("API key is required to call the LLM")
+    
+    client = OpenAI(api_key=api_key)
+    messages, model, options = _build_request(prompt, conversation_history, images)
+    
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        **options
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
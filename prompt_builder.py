@@ -0,0 +1,79 @@
+"""
+Prompt construction shared by every provider.
+
+Messages are assembled as an append-only sequence - system prompt, then the
+history exactly as it was sent before, then the new turn - so that servers
+with prefix caching (Ollama's KV cache in particular) only have to evaluate
+the new turn instead of the whole thread.
+"""
+
+# Kept constant so the first message of every request is byte-identical
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Uploaded documents are truncated to keep prompts within the models' context
+MAX_DOCUMENT_CHARS = 10000
+
+
+def build_user_turn(prompt, file_name=None, file_content=None):
+    """
+    Build the text sent to the model for a user turn.
+
+    Document context always goes in the same place - at the start of the turn,
+    before the question - using a fixed template.
+
+    Args:
+        prompt (str): The user's message
+        file_name (str): Name of the uploaded document, if any
+        file_content (str): Extracted document text, if any
+
+    Returns:
+        str: The turn content to send (and store as the message's llm_content)
+    """
+    if file_content is None:
+        return prompt
+
+    if len(file_content) > MAX_DOCUMENT_CHARS:
+        file_content = file_content[:MAX_DOCUMENT_CHARS] + "\n[Content truncated due to length...]"
+
+    return f"""The user has uploaded a file ({file_name}) with the following content:
+
+FILE CONTENT:
+{file_content}
+
+USER QUERY:
+{prompt}
+
+Please respond to the user's query based on the file content."""
+
+
+def build_conversation_history(messages, system_prompt=SYSTEM_PROMPT):
+    """
+    Turn stored messages into the history list the provider functions expect.
+
+    Each message is replayed with the content the model originally saw
+    (its llm_content when it had one), so earlier turns never change between requests.
+
+    Args:
+        messages (list): Message dicts from ChatDatabase.get_conversation_history
+        system_prompt (str): System prompt to put first, or None for none
+
+    Returns:
+        list: [{"role": ..., "content": ...}, ...]
+    """
+    history = []
+    if system_prompt:
+        history.append({"role": "system", "content": system_prompt})
+
+    previous_group = None
+    for msg in messages:
+        # Compare mode stores several answers to one prompt; only the first is replayed
+        group_id = msg.get("group_id")
+        if group_id and group_id == previous_group:
+            continue
+        previous_group = group_id
+
+        history.append({
+            "role": msg["role"],
+            "content": msg["content"]
+        })
+    return history
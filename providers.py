@@ -0,0 +1,137 @@
+import copy
+import logging
+import time
+
+from rate_limit import key_id, rate_limiter
+
+# The provider modules are imported on first use: openai and replicate are slow to
+# import and never needed in offgrid mode.
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)"""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+class Provider:
+    """
+    A configured chat backend.
+
+    Wraps one of the call_* functions with its settings (API key, model) so
+    callers can dispatch a prompt without knowing which backend it is. The
+    settings are captured up front, which also makes a Provider safe to call
+    from worker threads that have no Streamlit session state.
+
+    `call` gets an on_attempt keyword and must call it before every attempt
+    it makes (retries included); that is where the rate limits are applied.
+    """
+
+    def __init__(self, name, kind, call, session_id=None, key_id=None, on_usage=None, stream=None,
+                 session_limited=True):
+        self.name = name  # Shown to the user and stored with each answer
+        self.kind = kind  # 'openai', 'replicate' or 'ollama'
+        self.session_id = session_id  # Caller, for per-session rate limits and usage accounting
+        self.key_id = key_id  # Hash of the API key, for per-key rate limits
+        self.on_usage = on_usage  # Called with the token usage of every answered request
+        self._call = call
+        self._stream = stream  # Generator version of `call`, for backends that can stream
+        self.session_limited = session_limited  # Whether requests count against the session's rate limit
+
+    def _record_usage(self, prompt, conversation_history, response, start):
+        if not (self.on_usage and response):
+            return
+        prompt_tokens = estimate_tokens(prompt) + sum(
+            estimate_tokens(message.get("content")) for message in conversation_history or []
+        )
+        try:
+            self.on_usage(
+                session_id=self.session_id,
+                provider=self.name,
+                key_id=self.key_id,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=estimate_tokens(response),
+                latency=time.perf_counter() - start
+            )
+        except Exception as e:
+            # Accounting must never lose the user an answer
+            logging.error(f"Failed to record usage for {self.name}: {str(e)}")
+
+    def _acquire(self):
+        # Enforced before dispatch, so a throttled request never reaches the backend
+        rate_limiter.acquire(self.kind, session_id=self.session_id if self.session_limited else None,
+                             key_id=self.key_id)
+
+    def without_session_limit(self):
+        """A copy whose requests don't count against the session's rate limit (key and provider limits still apply)"""
+        provider = copy.copy(self)
+        provider.session_limited = False
+        return provider
+
+    def __call__(self, prompt, conversation_history=None, **kwargs):
+        start = time.perf_counter()
+        # The call_* functions retry on their own; every attempt reaches the backend, so each is metered
+        response = self._call(prompt, conversation_history=conversation_history, on_attempt=self._acquire, **kwargs)
+        self._record_usage(prompt, conversation_history, response, start)
+        return response
+
+    def stream(self, prompt, conversation_history=None, **kwargs):
+        """
+        Yield the answer in chunks. Backends that can't stream yield the
+        whole answer as a single chunk.
+        """
+        if self._stream is None:
+            yield self(prompt, conversation_history=conversation_history, **kwargs)
+            return
+
+        self._acquire()
+
+        start = time.perf_counter()
+        chunks = []
+        for chunk in self._stream(prompt, conversation_history=conversation_history, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._record_usage(prompt, conversation_history, "".join(chunks), start)
+
+    def __repr__(self):
+        return f"Provider({self.name!r})"
+
+
+def openai_provider(api_key, session_id=None, on_usage=None):
+    """OpenAI o3-mini"""
+    def call(prompt, **kwargs):
+        from openai_llm import call_openai_llm
+        return call_openai_llm(prompt, api_key, **kwargs)
+
+    def stream(prompt, **kwargs):
+        from openai_llm import stream_openai_llm
+        return stream_openai_llm(prompt, api_key, **kwargs)
+
+    return Provider("OpenAI/o3-mini", "openai", call, session_id=session_id, key_id=key_id(api_key),
+                    on_usage=on_usage, stream=stream)
+
+
+def replicate_provider(api_key, model_id="meta/meta-llama-3-70b-instruct", session_id=None, on_usage=None):
+    """Any Replicate language model (images are not sent; Replicate models have no common image format)"""
+    def call(prompt, images=None, **kwargs):
+        from replicate_llms import call_replicate_model
+        return call_replicate_model(prompt, api_key=api_key, model_id=model_id, **kwargs)
+
+    return Provider(f"Replicate/{model_id}", "replicate", call, session_id=session_id, key_id=key_id(api_key),
+                    on_usage=on_usage)
+
+
+def ollama_provider(model, session_id=None, on_wait=None, on_usage=None):
+    """A model on the local Ollama server (a call's own on_wait replaces the provider's)"""
+    def call(prompt, **kwargs):
+        from ollama_llm import call_ollama_llm
+        kwargs.setdefault("on_wait", on_wait)
+        return call_ollama_llm(prompt, model=model, session_id=session_id, **kwargs)
+
+    def stream(prompt, **kwargs):
+        from ollama_llm import stream_ollama_llm
+        kwargs.setdefault("on_wait", on_wait)
+        return stream_ollama_llm(prompt, model=model, session_id=session_id, **kwargs)
+
+    return Provider(f"Ollama/{model}", "ollama", call, session_id=session_id, on_usage=on_usage, stream=stream)
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+import time
+
+# Requests per minute; 0 disables the limit. Each bucket also allows a burst of this many requests.
+DEFAULT_SESSION_RPM = float(os.environ.get("OFFGRID_RATE_LIMIT_SESSION_RPM", "20"))
+DEFAULT_KEY_RPM = float(os.environ.get("OFFGRID_RATE_LIMIT_KEY_RPM", "60"))
+DEFAULT_PROVIDER_RPM = float(os.environ.get("OFFGRID_RATE_LIMIT_PROVIDER_RPM", "120"))
+# Buckets idle for this long are full again and can be forgotten
+IDLE_BUCKET_SECONDS = 3600
+
+
+class RateLimitExceeded(Exception):
+    """Raised before a request is dispatched when one of its rate limits is exhausted"""
+
+    def __init__(self, scope, retry_after):
+        self.scope = scope  # 'session', 'key' or 'provider'
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit reached for this {scope}, please try again in {retry_after:.0f}s")
+
+
+def key_id(api_key):
+    """Short, non-reversible identifier for an API key (the key itself is never stored)"""
+    if not api_key:
+        return None
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        # `now` can be slightly older than `updated` for a bucket created after it was read
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now, amount=1.0):
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount=1.0):
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Per-session, per-API-key and per-provider request limits, shared by every
+    session in the process.
+
+    A request is only admitted when all of its buckets have room, and then
+    takes one token from each, so a rejected request doesn't use up any
+    other limit.
+    """
+
+    def __init__(self, session_rpm=DEFAULT_SESSION_RPM, key_rpm=DEFAULT_KEY_RPM,
+                 provider_rpm=DEFAULT_PROVIDER_RPM):
+        self.limits = {
+            "session": session_rpm,
+            "key": key_rpm,
+            "provider": provider_rpm
+        }
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, scope, name):
+        bucket = self._buckets.get((scope, name))
+        if bucket is None:
+            rpm = self.limits[scope]
+            bucket = self._buckets[(scope, name)] = TokenBucket(rpm / 60.0, max(1.0, rpm))
+        return bucket
+
+    def _forget_idle(self, now):
+        idle = [k for k, bucket in self._buckets.items() if now - bucket.updated > IDLE_BUCKET_SECONDS]
+        for k in idle:
+            del self._buckets[k]
+
+    def acquire(self, provider, session_id=None, key_id=None):
+        """
+        Admit one request or raise RateLimitExceeded.
+
+        Args:
+            provider (str): Provider kind ('openai', 'replicate' or 'ollama')
+            session_id (str): The calling browser session, if known
+            key_id (str): Identifier of the API key used (see key_id())
+        """
+        # Most specific first, so the error names the limit the caller can do something about
+        scopes = [("session", session_id), ("key", key_id), ("provider", provider)]
+        scopes = [(scope, name) for scope, name in scopes if name and self.limits[scope] > 0]
+
+        with self._lock:
+            now = time.monotonic()
+            self._forget_idle(now)
+            buckets = [(scope, self._bucket(scope, name)) for scope, name in scopes]
+
+            for scope, bucket in buckets:
+                retry_after = bucket.wait_time(now)
+                if retry_after > 0:
+                    raise RateLimitExceeded(scope, retry_after)
+
+            for _, bucket in buckets:
+                bucket.take()
+
+
+rate_limiter = RateLimiter()
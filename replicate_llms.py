@@ -7,7 +7,7 @@ import logging
 
 
 
-def call_replicate_model(prompt, api_key=None, model_id="meta/meta-llama-3-70b-instruct", max_retries=3, retry_delay=2, conversation_history=None, model_params=None):
+def call_replicate_model(prompt, api_key=None, model_id="meta/meta-llama-3-70b-instruct", max_retries=3, retry_delay=2, conversation_history=None, model_params=None, on_attempt=None):
     """
     Call any model via Replicate API with proper error handling and retries.
     
@@ -19,6 +19,7 @@ def call_replicate_model(prompt, api_key=None, model_id="meta/meta-llama-3-70b-i
         retry_delay (int): Delay between retries in seconds
         conversation_history (list): List of previous messages in the conversation
         model_params (dict): Additional parameters specific to the model
+        on_attempt (callable): Called before every attempt, including retries; an exception from it is not retried
         
     Returns:
         str: The LLM response text
@@ -96,6 +97,9 @@ def call_replicate_model(prompt, api_key=None, model_id="meta/meta-llama-3-70b-i
     full_response = ""
     
     while retries <= max_retries:
+        # Outside the try: a rate limit from the caller must not be retried
+        if on_attempt:
+            on_attempt()
         try:
             # Collect the full response from the stream
             full_response = ""
@@ -0,0 +1,262 @@
+import logging
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from rate_limit import RateLimitExceeded
+
+# Percentile of the primary's recent latency after which a hedged request is sent
+DEFAULT_HEDGE_PERCENTILE = 95
+# Don't hedge until a provider has this many recorded latencies
+MIN_HEDGE_SAMPLES = 5
+# Chain-of-thought that reasoning models (e.g. deepseek-r1) stream before their answer
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+class LatencyTracker:
+    """Recent successful-call latencies per provider, shared across sessions"""
+
+    def __init__(self, window=100):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider_name, latency):
+        with self._lock:
+            self._samples.setdefault(provider_name, deque(maxlen=self.window)).append(latency)
+
+    def percentile(self, provider_name, pct, min_samples=MIN_HEDGE_SAMPLES):
+        """Latency percentile in seconds, or None if there isn't enough data yet"""
+        with self._lock:
+            samples = sorted(self._samples.get(provider_name, ()))
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round((len(samples) - 1) * pct / 100.0)))
+        return samples[index]
+
+
+latency_tracker = LatencyTracker()
+
+
+def _timed_call(provider, prompt, conversation_history, call_kwargs):
+    start = time.perf_counter()
+    response = provider(prompt, conversation_history=conversation_history, **call_kwargs)
+    latency = time.perf_counter() - start
+    latency_tracker.record(provider.name, latency)
+    return response, latency
+
+
+def route_request(primary, prompt, conversation_history=None, fallbacks=None, hedge_percentile=None,
+                  primary_max_retries=1, images=None, on_fallback=None):
+    """
+    Send a prompt to `primary`, falling back to the next provider when it fails.
+
+    With hedge_percentile set, a duplicate request also goes to the first
+    fallback once the primary has been running longer than that percentile of
+    its recent latencies. The first successful answer wins. A loser that
+    hasn't started yet is cancelled; one that is already running can't be
+    interrupted, so its answer is discarded.
+
+    Args:
+        primary (Provider): The preferred provider
+        prompt (str): The prompt to send
+        conversation_history (list): Previous messages in the conversation
+        fallbacks (list): Providers to try, in order, if the primary fails
+        hedge_percentile (float): Enable hedging at this latency percentile (e.g. 95)
+        primary_max_retries (int): Retries for the primary when fallbacks exist,
+            so a dead provider fails over quickly instead of retrying for long
+        images (list): Base64 JPEG images attached to the prompt
+        on_fallback (callable): Called as on_fallback(provider) just before a
+            hedged or failover request is sent
+
+    Returns:
+        dict: provider (name of the provider that answered), response, latency,
+            failed_over (a fallback answered after the primary failed) and
+            hedged (a hedged request was sent)
+
+    Raises:
+        RateLimitExceeded: When nothing answered and a rate limit was hit. A
+            rate-limited primary is not failed over: the fallback would only
+            spend more of the caller's budget.
+    """
+    fallbacks = list(fallbacks or [])
+    pending = list(fallbacks)
+    errors = []
+    hedged = False
+    primary_failed = False
+    rate_limited = None
+
+    hedge_delay = None
+    if hedge_percentile and fallbacks:
+        hedge_delay = latency_tracker.percentile(primary.name, hedge_percentile)
+
+    executor = ThreadPoolExecutor(max_workers=1 + len(fallbacks))
+    in_flight = {}
+
+    def launch(provider, call_kwargs=None):
+        if provider is not primary and on_fallback:
+            on_fallback(provider)
+        call_kwargs = dict(call_kwargs or {})
+        if images:
+            call_kwargs["images"] = images
+        future = executor.submit(_timed_call, provider, prompt, conversation_history, call_kwargs)
+        in_flight[future] = provider
+
+    try:
+        started = time.perf_counter()
+        launch(primary, {"max_retries": primary_max_retries} if fallbacks else None)
+
+        while in_flight:
+            timeout = None
+            if hedge_delay is not None and not hedged and pending:
+                timeout = max(0.0, hedge_delay - (time.perf_counter() - started))
+
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # The primary is slower than usual - send a hedged duplicate
+                hedged = True
+                provider = pending.pop(0)
+                logging.info(f"Hedging slow request to {primary.name} with {provider.name}")
+                launch(provider)
+                continue
+
+            for future in done:
+                provider = in_flight.pop(future)
+                try:
+                    response, latency = future.result()
+                except RateLimitExceeded as e:
+                    logging.info(f"{provider.name} was rate limited: {str(e)}")
+                    rate_limited = e
+                    if provider is primary:
+                        primary_failed = True
+                        pending.clear()
+                    continue
+                except Exception as e:
+                    logging.error(f"{provider.name} failed: {str(e)}")
+                    errors.append(f"{provider.name}: {str(e)}")
+                    if provider is primary:
+                        primary_failed = True
+                    continue
+
+                # Winner found - drop every other request
+                for other in in_flight:
+                    other.cancel()
+                return {
+                    "provider": provider.name,
+                    "response": response,
+                    "latency": latency,
+                    "failed_over": primary_failed,
+                    "hedged": hedged
+                }
+
+            # Everything in flight has failed - fail over to the next provider
+            if not in_flight and pending:
+                provider = pending.pop(0)
+                logging.info(f"Failing over to {provider.name}")
+                launch(provider)
+
+        if rate_limited is not None:
+            raise rate_limited
+        raise Exception("All providers failed: " + "; ".join(errors))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _DraftStopped(Exception):
+    """Raised in the draft's scheduler wait to leave the queue"""
+
+
+def _strip_reasoning(text):
+    """Drop <think> sections (including one still being streamed) from a reasoning model's output"""
+    text = _THINK_BLOCK.sub("", text)
+    if "<think>" in text:
+        text = text[:text.index("<think>")]
+    return text.strip()
+
+
+def route_request_with_draft(primary, prompt, draft_provider, on_draft, conversation_history=None, **route_kwargs):
+    """
+    route_request(), while a quick draft from `draft_provider` streams in the meantime.
+
+    The draft is shown through on_draft and then thrown away: it is read on a
+    worker thread, the call returns as soon as the routed request finishes
+    (even mid-draft, or before the draft's first chunk), and only the routed
+    answer is returned. A failing draft is ignored. The draft also stops when
+    route_request hedges or fails over, so a local fallback doesn't queue
+    behind it on the Ollama scheduler.
+
+    The draft doesn't count against the session's rate limit, so it never
+    takes the budget the routed request (or its retries and fallbacks) needs.
+    A reasoning model's <think> section is not shown as draft.
+
+    Args:
+        primary (Provider): The provider whose answer counts
+        prompt (str): The prompt to send
+        draft_provider (Provider): Fast (usually local) provider for the draft
+        on_draft (callable): Called in the calling thread as on_draft(draft_so_far) for every chunk
+        conversation_history (list): Previous messages in the conversation
+        **route_kwargs: Passed on to route_request (fallbacks, hedge_percentile, images, ...)
+
+    Returns:
+        dict: The route_request result, plus drafted (whether any draft was shown)
+    """
+    draft_provider = draft_provider.without_session_limit()
+    chunks = queue.Queue()
+    stop = threading.Event()
+    routed_done = object()
+
+    draft_kwargs = {}
+    if draft_provider.kind == "ollama":
+        def leave_queue_when_stopped(position, estimated_wait):
+            if stop.is_set():
+                raise _DraftStopped()
+        draft_kwargs["on_wait"] = leave_queue_when_stopped
+
+    def read_draft():
+        if stop.is_set():
+            return
+        stream = draft_provider.stream(prompt, conversation_history=conversation_history, **draft_kwargs)
+        try:
+            for chunk in stream:
+                # Checked between chunks: closing the stream releases the scheduler slot
+                if stop.is_set():
+                    break
+                chunks.put(chunk)
+        except _DraftStopped:
+            pass
+        except Exception as e:
+            logging.info(f"Draft from {draft_provider.name} failed: {str(e)}")
+        finally:
+            stream.close()
+
+    def stop_draft(provider):
+        stop.set()
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        routed = executor.submit(route_request, primary, prompt, conversation_history=conversation_history,
+                                 on_fallback=stop_draft, **route_kwargs)
+        # Wakes the loop below as soon as the routed answer (or error) is in
+        routed.add_done_callback(lambda future: chunks.put(routed_done))
+        executor.submit(read_draft)
+
+        draft = ""
+        while True:
+            chunk = chunks.get()
+            if chunk is routed_done:
+                break
+            draft += chunk
+            visible = _strip_reasoning(draft)
+            if visible:
+                on_draft(visible)
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+    result = routed.result()
+    result["drafted"] = bool(_strip_reasoning(draft))
+    return result
@@ -0,0 +1,82 @@
+import base64
+import io
+
+import pytest
+from PIL import Image as PILImage
+from sqlalchemy import text
+
+from model import ChatDatabase
+
+FIELDS = ("role", "content", "timestamp", "provider", "group_id", "latency", "has_image")
+
+
+def image_data(color):
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (32, 32), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def snapshot(db):
+    """Every conversation's messages (without ids), image data and model history, for comparing databases"""
+    conversations = {}
+    for conversation in db.get_all_conversations():
+        conversation_id = conversation["conversation_id"]
+        conversations[conversation_id] = [
+            tuple(message[field] for field in FIELDS) + (message.get("image_bytes"),)
+            for message in db.get_conversation_messages(conversation_id)
+        ] + db.get_conversation_history(conversation_id)
+    return conversations
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Two conversations sharing an image, with a document turn and a compare group"""
+    db = ChatDatabase(str(tmp_path / "source.db"))
+    shared = image_data("red")
+    db.save_message("user", "What is this?", "first", shared)
+    db.save_message("assistant", "A red square.", "first", provider="Ollama/llama3", latency=1.5)
+    db.save_message("user", "[File attached: notes.txt]\n\nSummarize", "first",
+                    llm_content="FILE CONTENT:\nnotes\n\nUSER QUERY:\nSummarize")
+    db.save_message("assistant", "Short notes." * 200, "first", provider="OpenAI/o3-mini", group_id="g1")
+    db.save_message("assistant", "Notes.", "first", provider="Ollama/llama3", group_id="g1")
+    db.save_message("user", "And this one?", "second", shared)
+    db.save_message("user", "Another?", "second", image_data("blue"))
+    return db
+
+
+def test_round_trip(source, tmp_path):
+    archive = str(tmp_path / "archive.jsonl.gz")
+
+    assert source.export(None, archive) == {"messages": 7, "images": 2}
+    target = ChatDatabase(str(tmp_path / "target.db"))
+    assert target.import_(archive) == {"imported": 7, "skipped": 0}
+
+    assert snapshot(target) == snapshot(source)
+
+
+def test_interrupted_import_resumes(source, tmp_path):
+    archive = tmp_path / "archive.jsonl"
+    source.export(None, str(archive))
+    # An import that stopped after the first three messages (and the shared image)
+    partial = tmp_path / "partial.jsonl"
+    partial.write_text("".join(archive.read_text().splitlines(keepends=True)[:5]))
+    target = ChatDatabase(str(tmp_path / "target.db"))
+    assert target.import_(str(partial), batch_size=2) == {"imported": 3, "skipped": 0}
+
+    assert target.import_(str(archive), batch_size=2) == {"imported": 4, "skipped": 3}
+    assert snapshot(target) == snapshot(source)
+
+
+def test_import_over_images_without_content_hash(source, tmp_path):
+    """Re-importing into a database whose images predate content_hash"""
+    archive = str(tmp_path / "archive.jsonl")
+    source.export(None, archive)
+    expected = snapshot(source)
+
+    # The first use of the shared image is skipped, the second one must still be imported
+    source.delete_conversation("second")
+    with source.engine.begin() as connection:
+        connection.execute(text("UPDATE images SET content_hash = NULL"))
+
+    assert source.import_(archive) == {"imported": 2, "skipped": 5}
+    assert snapshot(source) == expected
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from ollama_scheduler import OllamaScheduler
+
+
+class Request:
+    """A request holding a scheduler slot on its own thread until release() is called"""
+
+    def __init__(self, scheduler, name, model, session_id, granted_order=None, on_wait=None):
+        self.name = name
+        self.granted = threading.Event()
+        self.error = None
+        self._release = threading.Event()
+
+        def run():
+            try:
+                with scheduler.slot(model, session_id=session_id, on_wait=on_wait, poll_interval=0.01):
+                    if granted_order is not None:
+                        granted_order.append(name)
+                    self.granted.set()
+                    self._release.wait(5)
+            except Exception as e:
+                self.error = e
+
+        queued = scheduler.status()["queued"] + scheduler.status()["active"]
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        # Wait until the request is queued or running, so requests enter in a known order
+        wait_until(lambda: scheduler.status()["queued"] + scheduler.status()["active"] > queued or self.error)
+
+    def release(self):
+        self._release.set()
+        self._thread.join(5)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+def test_sessions_take_turns():
+    scheduler = OllamaScheduler(max_concurrent=1, max_per_model=1, max_model_batch=4)
+    order = []
+    first = Request(scheduler, "a1", "llama3", "a", order)
+    first.granted.wait(5)
+    queued = [
+        Request(scheduler, "a2", "llama3", "a", order),
+        Request(scheduler, "a3", "llama3", "a", order),
+        Request(scheduler, "b1", "llama3", "b", order),
+    ]
+
+    by_name = {request.name: request for request in queued}
+    first.release()
+    for granted in range(2, len(queued) + 2):
+        wait_until(lambda: len(order) == granted)
+        by_name[order[-1]].release()
+
+    # Session b doesn't wait behind all of session a's requests
+    assert order == ["a1", "a2", "b1", "a3"]
+
+
+def test_loaded_model_is_preferred():
+    scheduler = OllamaScheduler(max_concurrent=1, max_per_model=1, max_model_batch=4)
+    order = []
+    first = Request(scheduler, "a1", "llama3", "a", order)
+    first.granted.wait(5)
+    other_model = Request(scheduler, "b1", "mistral", "b", order)
+    same_model = Request(scheduler, "c1", "llama3", "c", order)
+
+    first.release()
+    same_model.granted.wait(5)
+    same_model.release()
+    other_model.granted.wait(5)
+    other_model.release()
+
+    assert order == ["a1", "c1", "b1"]
+
+
+def test_per_model_bound():
+    scheduler = OllamaScheduler(max_concurrent=2, max_per_model=1)
+    first = Request(scheduler, "a1", "llama3", "a")
+    first.granted.wait(5)
+    same_model = Request(scheduler, "b1", "llama3", "b")
+    other_model = Request(scheduler, "c1", "mistral", "c")
+    other_model.granted.wait(5)
+
+    assert not same_model.granted.is_set()
+    assert scheduler.status() == {
+        "active": 2, "queued": 1, "loaded_model": "mistral", "running": {"llama3": 1, "mistral": 1}
+    }
+
+    first.release()
+    assert same_model.granted.wait(5)
+    same_model.release()
+    other_model.release()
+
+
+def test_raising_on_wait_leaves_the_queue():
+    scheduler = OllamaScheduler(max_concurrent=1)
+    first = Request(scheduler, "a1", "llama3", "a")
+    first.granted.wait(5)
+
+    def give_up(position, estimated_wait):
+        raise TimeoutError("gave up")
+
+    waiting = Request(scheduler, "b1", "llama3", "b", on_wait=give_up)
+    wait_until(lambda: waiting.error is not None)
+
+    assert isinstance(waiting.error, TimeoutError)
+    assert scheduler.status()["queued"] == 0
+    first.release()
+    assert scheduler.status()["active"] == 0
+
+
+def test_queue_position_and_wait():
+    scheduler = OllamaScheduler(max_concurrent=1, max_per_model=1, max_model_batch=4)
+    scheduler._service_times["llama3"] = 10.0
+    first = Request(scheduler, "a1", "llama3", "a")
+    first.granted.wait(5)
+    ahead = Request(scheduler, "b1", "llama3", "b")
+
+    positions = []
+    waiting = Request(scheduler, "c1", "llama3", "c", on_wait=lambda position, wait: positions.append((position, wait)))
+    wait_until(lambda: positions)
+
+    # One request queued ahead plus the one running, 10s each
+    assert positions[0] == (1, pytest.approx(20.0))
+
+    for request in (first, ahead, waiting):
+        request.release()
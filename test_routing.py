@@ -0,0 +1,205 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import ollama_llm
+import providers
+from providers import Provider, ollama_provider
+from rate_limit import RateLimiter, RateLimitExceeded
+from routing import latency_tracker, route_request, route_request_with_draft
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = "Internal Server Error" if status_code >= 500 else "OK"
+        self._body = body
+
+    def json(self):
+        if isinstance(self._body, Exception):
+            raise self._body
+        return self._body
+
+
+@pytest.fixture
+def ollama_down(monkeypatch):
+    """Every Ollama chat request fails to connect, without waiting between retries"""
+    def post(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("connection refused")
+
+    monkeypatch.setattr(ollama_llm.requests, "post", post)
+    monkeypatch.setattr(ollama_llm, "is_model_available", lambda model: None)
+    monkeypatch.setattr(ollama_llm.time, "sleep", lambda seconds: None)
+
+
+def answering(name, answer, delay=0.0):
+    def call(prompt, **kwargs):
+        # Not time.sleep, which the fixtures replace
+        threading.Event().wait(delay)
+        return answer
+    return Provider(name, "openai", call)
+
+
+def failing(name):
+    def call(prompt, **kwargs):
+        raise Exception("network unreachable")
+    return Provider(name, "openai", call)
+
+
+@pytest.mark.parametrize("status_code, body", [
+    (500, {"error": "model runner crashed"}),
+    (200, ValueError("not JSON")),
+    (200, {"done": True}),
+    (200, {"message": {"content": "  "}}),
+])
+def test_ollama_errors_raise(monkeypatch, status_code, body):
+    monkeypatch.setattr(ollama_llm.requests, "post", lambda *args, **kwargs: FakeResponse(status_code, body))
+    monkeypatch.setattr(ollama_llm, "is_model_available", lambda model: None)
+    monkeypatch.setattr(ollama_llm.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(Exception):
+        ollama_llm.call_ollama_llm("Hello", max_retries=1, model="llama3")
+
+
+def test_failover_skips_unreachable_ollama(ollama_down):
+    result = route_request(
+        failing("Test/failover-primary"),
+        "Hello",
+        fallbacks=[ollama_provider("llama3"), answering("Test/failover-last", "the real answer")]
+    )
+
+    assert result["provider"] == "Test/failover-last"
+    assert result["response"] == "the real answer"
+    assert result["failed_over"]
+
+
+def test_all_providers_failing_raises(ollama_down):
+    with pytest.raises(Exception, match="All providers failed"):
+        route_request(failing("Test/all-failed-primary"), "Hello", fallbacks=[ollama_provider("llama3")])
+
+
+def test_failed_hedge_is_ignored(ollama_down):
+    primary = answering("Test/hedged-primary", "the online answer", delay=0.3)
+    for _ in range(10):
+        latency_tracker.record(primary.name, 0.01)
+
+    result = route_request(primary, "Hello", fallbacks=[ollama_provider("llama3")], hedge_percentile=95)
+
+    assert result["hedged"]
+    assert result["provider"] == primary.name
+    assert result["response"] == "the online answer"
+
+
+
+def test_retries_are_rate_limited_and_not_failed_over(monkeypatch):
+    monkeypatch.setattr(providers, "rate_limiter", RateLimiter(session_rpm=2, key_rpm=0, provider_rpm=0))
+    attempts = []
+    fallback_calls = []
+
+    def flaky(prompt, on_attempt=None, max_retries=3, **kwargs):
+        # Retries like the call_* functions do
+        for _ in range(max_retries + 1):
+            on_attempt()
+            attempts.append(prompt)
+        raise Exception("backend error")
+
+    def fallback(prompt, **kwargs):
+        fallback_calls.append(prompt)
+        return "should not be asked"
+
+    with pytest.raises(RateLimitExceeded):
+        route_request(
+            Provider("Test/rate-limited-primary", "openai", flaky, session_id="rate-limited-session"),
+            "Hello",
+            fallbacks=[Provider("Test/rate-limited-fallback", "ollama", fallback, session_id="rate-limited-session")],
+            primary_max_retries=3
+        )
+
+    # Two attempts fit the session's budget; the third is refused before reaching the backend
+    assert len(attempts) == 2
+    assert fallback_calls == []
+
+
+def drafting(name, first_chunk_delay, stopped):
+    def stream(prompt, **kwargs):
+        try:
+            threading.Event().wait(first_chunk_delay)
+            while True:
+                yield "draft "
+                threading.Event().wait(0.01)
+        finally:
+            stopped.set()
+    return Provider(name, "replicate", lambda prompt, **kwargs: "unused", stream=stream)
+
+
+def test_routed_answer_is_not_held_back_by_a_slow_draft():
+    stopped = threading.Event()
+    drafts = []
+    started = time.perf_counter()
+
+    result = route_request_with_draft(
+        answering("Test/draft-primary", "the online answer", delay=0.1),
+        "Hello",
+        drafting("Test/slow-draft", 3.0, stopped),
+        drafts.append
+    )
+
+    assert time.perf_counter() - started < 1.0
+    assert result["response"] == "the online answer"
+    assert not result["drafted"]
+
+
+def test_draft_stops_when_failing_over():
+    stopped = threading.Event()
+    fallback_started = []
+
+    def fallback(prompt, **kwargs):
+        fallback_started.append(stopped.wait(1.0))
+        return "the fallback answer"
+
+    result = route_request_with_draft(
+        failing("Test/draft-failing-primary"),
+        "Hello",
+        drafting("Test/draft-until-failover", 0.0, stopped),
+        lambda draft: None,
+        fallbacks=[Provider("Test/draft-fallback", "openai", fallback)]
+    )
+
+    assert result["response"] == "the fallback answer"
+    # The draft had already been stopped when the fallback started
+    assert fallback_started == [True]
+
+
+def test_draft_does_not_use_the_session_rate_limit(monkeypatch):
+    monkeypatch.setattr(providers, "rate_limiter", RateLimiter(session_rpm=1, key_rpm=0, provider_rpm=0))
+    drafts = []
+    drafted = threading.Event()
+
+    def show_draft(draft):
+        drafts.append(draft)
+        drafted.set()
+
+    def primary(prompt, on_attempt=None, **kwargs):
+        # Admitted only after the draft has started streaming
+        drafted.wait(1.0)
+        on_attempt()
+        return "the online answer"
+
+    def stream(prompt, **kwargs):
+        yield "<think>The user says hello.</think>"
+        yield "Hi"
+
+    result = route_request_with_draft(
+        Provider("Test/limited-primary", "openai", primary, session_id="draft-session"),
+        "Hello",
+        Provider("Test/limited-draft", "ollama", lambda prompt, **kwargs: "unused", session_id="draft-session",
+                 stream=stream),
+        show_draft
+    )
+
+    # The session's only request went to the primary; the draft's chain-of-thought wasn't shown
+    assert result["response"] == "the online answer"
+    assert drafts == ["Hi"]